@@ -2,12 +2,12 @@ import asyncio
 import time
 import os
 import datetime
-from cognitive_layers.perception import extract_perception
+from cognitive_layers.perception import perceive
 from cognitive_layers.memory import MemoryManager, MemoryItem
 from cognitive_layers.decision import generate_plan
 from cognitive_layers.action import execute_tool
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from embedding_cache import get_query_cache
+from mcp_pool import MCPSessionPool
 import logging
 
 logging.basicConfig(
@@ -18,89 +18,74 @@ logging.basicConfig(
 
 max_steps = 3
 
-async def start_search(user_input: str):
+async def start_search(user_input: str, pool: MCPSessionPool):
+    """Run the agent loop for `user_input`, borrowing an MCP session from `pool` for each tool call."""
     try:
         logging.info("Starting agent...")
-        
-        server_params = StdioServerParameters(
-            command="python",
-            args=["mcp_server.py"],
-            cwd="D:\\code\\agentic-ai\\ai-assignments\\embeddings-demo\\backend"
-        )
 
         try:
-            async with stdio_client(server_params) as (read, write):
-                try:
-                    async with ClientSession(read, write) as session:
-                        logging.info("[agent] Session created, initializing...")
- 
-                        try:
-                            await session.initialize()
-                            logging.info("[agent] MCP session initialized")
-
-                            tools = await session.list_tools()
-                            # logging.info("Available tools:" [t.name for t in tools.tools])
-
-                            # Get available tools
-                            logging.info("Requesting tool list...")
-                            tools_result = await session.list_tools()
-                            tools = tools_result.tools
-                            tool_descriptions = "\n".join(
-                                f"- {tool.name}: {getattr(tool, 'description', 'No description')}" 
-                                for tool in tools
-                            )
-
-                            logging.info(f"agent: {len(tools)} tools loaded. {tool_descriptions}")
-
-                            memory = MemoryManager()
-                            session_id = f"session-{int(time.time())}"
-                            query = user_input
-                            step = 0
-
-                            while step < max_steps:
-                                logging.info(f"loop, Step {step + 1} started")
-
-                                perception = extract_perception(user_input)
-                                logging.info(f"perception, Intent: {perception.intent}, Tool hint: {perception.tool_hint}")
-
-                                retrieved = memory.retrieve(query=user_input, top_k=3, session_filter=session_id)
-                                logging.info(f"memory, Retrieved {len(retrieved)} relevant memories")
-
-                                plan = generate_plan(perception, retrieved, tool_descriptions=tool_descriptions)
-                                logging.info(f"plan, Plan generated: {plan}")
-
-                                try:
-                                    result = await execute_tool(session, tools, plan)
-                                    logging.info(f"tool, {result.tool_name} returned: {result.result}")
-
-                                    memory.add(MemoryItem(
-                                        text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}",
-                                        type="tool_output",
-                                        tool_name=result.tool_name,
-                                        user_query=user_input,
-                                        tags=[result.tool_name],
-                                        session_id=session_id
-                                    ))
-
-                                    user_input = f"Original task: {query}\nPrevious output: {result.result}\nWhat should I do next?"
-                                    # return result.result
-
-                                    if plan.startswith("FINAL_ANSWER:"):
-                                        logging.info(f"agent, FINAL RESULT: {plan}")
-                                        return
-
-                                except Exception as e:
-                                    logging.info(f"error, Tool execution failed: {e}")
-                                    break
-
-                                step += 1
-                        except Exception as e:
-                            logging.error(f"[agent] Session initialization error: {str(e)}")
-                except Exception as e:
-                    logging.errro(f"[agent] Session creation error: {str(e)}")
-        except Exception as e:
-            logging.error(f"[agent] Connection error: {str(e)}")
+            # Rendered once per distinct tool list and shared by every search
+            catalog = await pool.catalog()
+            tool_descriptions = catalog.description
+
+            logging.info(f"agent: {len(catalog.tools)} tools loaded. {tool_descriptions}")
+
+            memory = MemoryManager()
+            session_id = f"session-{int(time.time())}"
+            query = user_input
+            step = 0
+            perception = None
+            last_tool = None
+
+            while step < max_steps:
+                logging.info(f"loop, Step {step + 1} started")
+                # LLM calls are awaited on the async client and blocking embedding calls run in threads,
+                # so other searches on the loop keep going; perception and retrieval do not depend on each other
+
+                perception, retrieved = await asyncio.gather(
+                    perceive(user_input, perception, last_tool),
+                    # Keyed on the original query, which stays the same every step, so its embedding is cached
+                    asyncio.to_thread(memory.retrieve, query=query, top_k=3, session_filter=session_id)
+                )
+                logging.info(f"perception, Intent: {perception.intent}, Tool hint: {perception.tool_hint}")
+                logging.info(f"memory, Retrieved {len(retrieved)} relevant memories")
+
+                plan = await generate_plan(perception, retrieved, tool_descriptions=tool_descriptions)
+                logging.info(f"plan, Plan generated: {plan}")
+
+                # A session is borrowed only for the tool call, so searches waiting on the LLM
+                # do not keep the pool's servers from searches that are ready to call a tool
+                async with pool.session() as (session, _):
+                    try:
+                        result = await execute_tool(session, catalog.by_name, plan)
+                    except Exception as e:
+                        logging.info(f"error, Tool execution failed: {e}")
+                        break
+                logging.info(f"tool, {result.tool_name} returned: {result.result}")
+
+                await asyncio.to_thread(memory.add, MemoryItem(
+                    text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}",
+                    type="tool_output",
+                    tool_name=result.tool_name,
+                    user_query=user_input,
+                    tags=[result.tool_name],
+                    session_id=session_id
+                ))
+
+                last_tool = result.tool_name
+                user_input = f"Original task: {query}\nPrevious output: {result.result}\nWhat should I do next?"
+                # return result.result
+
+                if plan.startswith("FINAL_ANSWER:"):
+                    logging.info(f"agent, FINAL RESULT: {plan}")
+                    return
+
+                step += 1
+        except asyncio.TimeoutError:
+            logging.error("[agent] No MCP session became free in time")
     except Exception as e:
         logging.error(f"[agent] Overall error: {str(e)}")
+    finally:
+        logging.info(f"agent, query embedding cache: {get_query_cache().stats()}")
 
     logging.info("Agent session complete.")
@@ -1,25 +1,35 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from cognitive_layers.perception import extract_perception
-from markitdown import MarkItDown
+from markitdown import MarkItDown, StreamInfo
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import os
-import json
 import numpy as np
 from tqdm import tqdm
 from datetime import datetime
 from pathlib import Path
-import faiss
 import logging  # Import logging
-import ollama
 from agent import start_search
-import asyncio
+from embedder import batched, get_executor
+from embedding_cache import get_cache
+from shards import open_document_index
+from jobs import JobQueue
+from mcp_pool import BackgroundLoop, MCPSessionPool
+from chunking import chunk_text
+import atexit
+import gzip
+import io
+import queue
+import threading
 
 app = Flask(__name__)
 CORS(app)
 
 CHUNK_SIZE = 256
 CHUNK_OVERLAP = 40
-EMBED_URL = "http://localhost:11434/api/embeddings"
+# Set CHUNK_STRUCTURED=1 to chunk along Markdown headings and paragraphs
+CHUNK_STRUCTURED = os.getenv("CHUNK_STRUCTURED", "").lower() in ("1", "true", "yes")
 EMBED_MODEL = "nomic-embed-text"
 
 # Configure logging
@@ -33,14 +43,157 @@ logging.basicConfig(
 PROCESSED_DIR = "processed_documents"
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    words = text.split()
-    for i in range(0, len(words), size - overlap):
-        yield " ".join(words[i:i+size])
+# Raw HTML is only archived to doc_store (gzip-compressed) when ARCHIVE_HTML is set
+ARCHIVE_HTML = os.getenv("ARCHIVE_HTML", "").lower() in ("1", "true", "yes")
+DOC_STORE = Path(__file__).parent.resolve() / "doc_store"
+if ARCHIVE_HTML:
+    os.makedirs(DOC_STORE, exist_ok=True)
+archive_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+CONVERT_WORKERS = int(os.getenv("CONVERT_WORKERS", 4))
+convert_pool = ThreadPoolExecutor(max_workers=CONVERT_WORKERS, thread_name_prefix="convert")
+
+# One converter for the whole process instead of one per request
+markitdown = MarkItDown()
+
+# Loaded once and kept in memory; checkpointed in the background and at shutdown
+# (one index, or one per shard when INDEX_SHARD_BY is set)
+doc_index = open_document_index()
+doc_index.start_checkpointer()
+atexit.register(doc_index.close)
+
+def archive_html(file_name, html_content):
+    with gzip.open(file_name, "wt", encoding="utf-8") as file:
+        file.write(html_content)
+
+def convert_page(url, html_content):
+    """Archive (optionally) and convert one page, returning its timestamp, archive file and chunks."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    file_name = None
+    if ARCHIVE_HTML:
+        # Keep a compressed copy of the raw page without holding up the ingestion
+        file_name = f"{DOC_STORE}/{timestamp}_{url.replace('://', '_').replace('/', '_')}.html.gz"
+        archive_pool.submit(archive_html, file_name, html_content)
+
+    # Convert HTML to Markdown straight from the request body
+    markdown_content = markitdown.convert_stream(
+        io.BytesIO(html_content.encode("utf-8")),
+        stream_info=StreamInfo(mimetype="text/html", extension=".html", charset="utf-8", url=url)
+    )
+
+    # Create chunks
+    chunks = list(chunk_text(markdown_content.text_content, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_STRUCTURED))
+    logging.info(f"Done chunks for {url}. Size {len(chunks)}")
+    return timestamp, file_name, chunks
+
+def ingest_page(job, url, html_content):
+    """Convert, chunk and embed one page, reporting progress on `job`."""
+    timestamp, file_name, chunks = convert_page(url, html_content)
+
+    with doc_index.url_lock(url):
+        # Only chunks whose text changed since the last save of this URL are embedded again
+        changed, stale = doc_index.diff(url, chunks)
+        job.chunks_total = len(changed)
+        logging.info(f"Re-embedding {len(changed)} of {len(chunks)} chunks, replacing {len(stale)} stale vectors")
+
+        embeddings = []
+        with tqdm(total=len(changed), desc=f"Embedding {url}") as progress:
+            changed_chunks = [chunks[position] for position in changed]
+            for batch, batch_embeddings in get_executor().map(batched(changed_chunks)):
+                embeddings.append(batch_embeddings)
+                job.chunks_embedded += len(batch)
+                progress.update(len(batch))
+
+        # Drop the old vectors only once every new embedding exists, so a failed
+        # embedding call leaves the page as it was; the transaction rolls the removal
+        # back if the add fails, and checkpoints both together (as ingest_batch does)
+        with doc_index.transaction():
+            doc_index.remove(stale)
+            if changed:
+                doc_index.add(url, file_name, timestamp, changed, changed_chunks, np.concatenate(embeddings))
+    cache_stats = get_cache().stats()
+    logging.info(f"Embedding cache: {cache_stats}")
+
+    return {
+        'chunks_processed': len(chunks),
+        'chunks_embedded': len(changed),
+        'chunks_removed': len(stale),
+        'embedding_cache': cache_stats,
+        'file_saved': file_name
+    }
+
+def ingest_batch(job, pages):
+    """Ingest many pages at once: convert them in parallel, embed their chunks in
+    shared batches and write every page to the index in a single checkpoint."""
+    # A URL sent twice in one batch keeps its last copy
+    pages = list({page['url']: page for page in pages}.values())
+    results = {page['url']: {'url': page['url']} for page in pages}
+
+    def convert(page):
+        try:
+            return page['url'], convert_page(page['url'], page['html_content'])
+        except Exception as e:
+            logging.error(f"exception converting {page['url']}: {e}")
+            results[page['url']].update(status='error', error=str(e))
+            return page['url'], None
+
+    converted = [(url, page) for url, page in convert_pool.map(convert, pages) if page is not None]
+
+    with ExitStack() as stack:
+        # Sorted so two overlapping batches always take the URL locks in the same order
+        for url in sorted(url for url, _ in converted):
+            stack.enter_context(doc_index.url_lock(url))
+
+        work = []
+        for url, (timestamp, file_name, chunks) in converted:
+            changed, stale = doc_index.diff(url, chunks)
+            work.append((url, timestamp, file_name, chunks, changed, stale))
+        pending = [chunks[position] for _, _, _, chunks, changed, _ in work for position in changed]
+        job.chunks_total = len(pending)
+        logging.info(f"Batch of {len(pages)} pages: embedding {len(pending)} chunks")
+
+        embeddings = []
+        for batch, batch_embeddings in get_executor().map(batched(pending)):
+            embeddings.append(batch_embeddings)
+            job.chunks_embedded += len(batch)
+        embeddings = np.concatenate(embeddings) if embeddings else None
+
+        offset = 0
+        with doc_index.transaction():
+            for url, timestamp, file_name, chunks, changed, stale in work:
+                doc_index.remove(stale)
+                if changed:
+                    doc_index.add(
+                        url, file_name, timestamp, changed,
+                        [chunks[position] for position in changed],
+                        embeddings[offset:offset + len(changed)]
+                    )
+                offset += len(changed)
+                results[url].update(
+                    status='success',
+                    chunks_processed=len(chunks),
+                    chunks_embedded=len(changed),
+                    chunks_removed=len(stale),
+                    file_saved=file_name
+                )
 
-def get_embedding(text: str) -> np.ndarray:
-    response = ollama.embeddings(model='nomic-embed-text', prompt=text)
-    return np.array(response["embedding"], dtype=np.float32)
+    return {
+        'pages': list(results.values()),
+        'embedding_cache': get_cache().stats()
+    }
+
+# Warm MCP servers for /search, kept on one event loop for the life of the backend
+search_loop = BackgroundLoop()
+mcp_pool = MCPSessionPool()
+search_loop.run(mcp_pool.start())
+atexit.register(lambda: search_loop.run(mcp_pool.close(), timeout=30))
+# Searches allowed at once; beyond this /search answers 503 with Retry-After instead of queueing
+SEARCH_MAX_CONCURRENT = int(os.getenv("SEARCH_MAX_CONCURRENT", 8))
+SEARCH_RETRY_AFTER = int(os.getenv("SEARCH_RETRY_AFTER", 5))
+search_slots = threading.BoundedSemaphore(SEARCH_MAX_CONCURRENT)
+
+ingest_jobs = JobQueue(ingest_page)
+batch_jobs = JobQueue(ingest_batch, workers=1)
 
 @app.route('/process', methods=['POST'])
 def process_url():
@@ -48,75 +201,60 @@ def process_url():
     data = request.json
     url = data.get('url')
     html_content = data.get('html_content')
-    ROOT = Path(__file__).parent.resolve()
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
-
-    DOC_STORE = ROOT / "doc_store"
-    os.makedirs(DOC_STORE, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
     if not url or not html_content:
         logging.error("error: URL and HTML content are required")
         return jsonify({'error': 'URL and HTML content are required'}), 400
-    
+
     try:
-        # Save HTML data into file
+        job = ingest_jobs.submit(url=url, html_content=html_content)
+    except queue.Full:
+        logging.error("error: ingestion queue is full")
+        return jsonify({'error': 'Ingestion queue is full, retry later'}), 503
 
-        file_name = f"{DOC_STORE}/{timestamp}_{url.replace('://', '_').replace('/', '_')}.htmlhtml_file_content.txt"
-        file = open(file_name, "w", encoding="utf-8")
-        file.write(html_content)
-        file.close()
-
-        # Convert HTML to Markdown using MarkItDown
-        markitdown = MarkItDown()
-        markdown_content = markitdown.convert(file_name)
-        
-        index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
-        metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-
-        document_data = {
-            'url': url,
-            'markdown_content': markdown_content.text_content,
-            'timestamp': timestamp
-        }
-
-        # Create chunks
-        chunks = list(chunk_text(markdown_content.text_content))
-        logging.info(f"Done chunks. Size {len(chunks)}")
-
-        embeddings_for_file = []
-        new_metadata = []
-        for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file_name}")):
-            embedding = get_embedding(chunk)
-            embeddings_for_file.append(embedding)
-            new_metadata.append({"url":url, "doc": file_name, "chunk": chunk})
-        if embeddings_for_file:
-            if index is None:
-                dim = len(embeddings_for_file[0])
-                index = faiss.IndexFlatL2(dim)
-            index.add(np.stack(embeddings_for_file))
-            metadata.extend(new_metadata)
-        # CACHE_META[file.name] = fhash
-
-        METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-        if index and index.ntotal > 0:
-            faiss.write_index(index, str(INDEX_FILE))
-            logging.info("Saved FAISS index and metadata")
-
-        return jsonify({
-            'status': 'success',
-            'chunks_processed': "num_chunks",
-            'file_saved': file_name
-        })
-        
-    except Exception as e:
-        logging.error(f"exception: {e}")
-        return jsonify({'error': str(e)}), 500
+    logging.info(f"Queued job {job.id} for {url}")
+    return jsonify({
+        'status': job.status,
+        'job_id': job.id
+    }), 202
+
+@app.route('/process-batch', methods=['POST'])
+def process_batch():
+    logging.info("inside process_batch")
+    data = request.get_json(silent=True)
+    pages = data.get('pages') if isinstance(data, dict) else None
+
+    if not isinstance(pages, list) or not pages or not all(
+        isinstance(page, dict) and page.get('url') and page.get('html_content') for page in pages
+    ):
+        logging.error("error: pages with URL and HTML content are required")
+        return jsonify({'error': 'A list of pages with URL and HTML content is required'}), 400
+
+    try:
+        job = batch_jobs.submit(pages=pages)
+    except queue.Full:
+        logging.error("error: batch ingestion queue is full")
+        return jsonify({'error': 'Ingestion queue is full, retry later'}), 503
+
+    logging.info(f"Queued batch job {job.id} for {len(pages)} pages")
+    return jsonify({
+        'status': job.status,
+        'job_id': job.id
+    }), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({
+        'pending': ingest_jobs.pending() + batch_jobs.pending(),
+        'jobs': [job.model_dump() for job in ingest_jobs.list() + batch_jobs.list()]
+    })
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = ingest_jobs.get(job_id) or batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.model_dump())
 
 @app.route('/search', methods=['POST'])
 def search():
@@ -126,7 +264,13 @@ def search():
     if not query:
         return jsonify({'error': 'Query is required'}), 400
 
-    result = asyncio.run(start_search(query))
+    if not search_slots.acquire(blocking=False):
+        logging.error("error: too many searches in progress")
+        return jsonify({'error': 'Too many searches in progress, retry later'}), 503, {'Retry-After': str(SEARCH_RETRY_AFTER)}
+    try:
+        result = search_loop.run(start_search(query, mcp_pool))
+    finally:
+        search_slots.release()
 
     logging.info(f"Received result {result}")
     
@@ -134,5 +278,11 @@ def search():
         'results': result
     })
 
+@app.route('/search/status', methods=['GET'])
+def search_status():
+    return jsonify(mcp_pool.status())
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5001) 
\ No newline at end of file
+    # The reloader would import this module twice (watcher and server), starting a second
+    # resident index, job workers and MCP pool; restart by hand after code changes instead
+    app.run(debug=True, port=5001, use_reloader=False) 
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""Async server mode: the Flask backend behind an ASGI app whose /search does not hold a thread.
+
+    uvicorn asgi:app --port 5001
+
+/search awaits the agent on the backend's persistent search loop (the one the
+MCP session pool lives on), so concurrent searches interleave their LLM and
+tool waits. Every other route is the unchanged Flask app, run in a threadpool.
+"""
+import asyncio
+import logging
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route, request_response
+from agent import start_search
+from app import SEARCH_RETRY_AFTER, app as flask_app, mcp_pool, search_loop, search_slots
+
+
+async def search(request: Request):
+    data = await request.json()
+    query = data.get('query')
+    logging.info(f"Starting search with query {query}")
+    if not query:
+        return JSONResponse({'error': 'Query is required'}, status_code=400)
+
+    if not search_slots.acquire(blocking=False):
+        logging.error("error: too many searches in progress")
+        return JSONResponse(
+            {'error': 'Too many searches in progress, retry later'},
+            status_code=503,
+            headers={'Retry-After': str(SEARCH_RETRY_AFTER)}
+        )
+    try:
+        result = await asyncio.wrap_future(search_loop.submit(start_search(query, mcp_pool)))
+    finally:
+        search_slots.release()
+
+    logging.info(f"Received result {result}")
+    return JSONResponse({'results': result})
+
+
+# flask_cors only covers the Flask routes, so the async route gets its own CORS handling
+search_app = CORSMiddleware(request_response(search), allow_origins=["*"], allow_methods=["POST"], allow_headers=["*"])
+
+app = Starlette(routes=[
+    Route('/search', search_app),
+    Mount('/', WSGIMiddleware(flask_app)),
+])
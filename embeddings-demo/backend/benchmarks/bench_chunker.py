@@ -0,0 +1,68 @@
+"""Compare the streaming chunker with the original split/join chunk_text.
+
+    python benchmarks/bench_chunker.py --mb 2 8 32
+"""
+from pathlib import Path
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chunking import CHUNK_OVERLAP, CHUNK_SIZE, iter_chunks
+
+
+def legacy_chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    words = text.split()
+    for i in range(0, len(words), size - overlap):
+        yield " ".join(words[i:i+size])
+
+
+def make_markdown(megabytes: float) -> str:
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    parts, length = [], 0
+    while length < megabytes * 1024 * 1024:
+        if rng.random() < 0.1:
+            part = f"## Section {len(parts)}\n\n"
+        else:
+            part = " ".join(rng.choices(vocabulary, k=rng.randint(20, 200))) + "\n\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def measure(chunker, text):
+    """Time one run, then repeat it under tracemalloc (which slows it down) for peak memory."""
+    started = time.perf_counter()
+    count = sum(1 for _ in chunker(text))
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    sum(1 for _ in chunker(text))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, nargs="+", default=[2, 8, 32], help="document sizes in MB")
+    args = parser.parse_args()
+
+    chunkers = {
+        "legacy chunk_text": legacy_chunk_text,
+        "iter_chunks": lambda text: iter_chunks(text),
+        "iter_chunks structured": lambda text: iter_chunks(text, structured=True),
+    }
+    print(f"{'size':>8}  {'chunker':<24}{'chunks':>8}{'seconds':>10}{'peak MB':>10}")
+    for megabytes in args.mb:
+        text = make_markdown(megabytes)
+        for name, chunker in chunkers.items():
+            count, elapsed, peak = measure(chunker, text)
+            print(f"{megabytes:>6.1f}MB  {name:<24}{count:>8}{elapsed:>10.3f}{peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
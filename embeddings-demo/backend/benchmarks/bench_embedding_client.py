@@ -0,0 +1,99 @@
+"""Compare a new connection per embedding call with the shared keep-alive client.
+
+Runs against a local stand-in for Ollama's /api/embed and /api/embeddings, so
+only HTTP and connection cost is measured, not the model.
+
+    python benchmarks/bench_embedding_client.py --calls 2000 --threads 1 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import requests
+
+from embedding_client import EmbeddingClient
+
+DIM = 768
+
+
+class StandInOllama(BaseHTTPRequestHandler):
+    """Answers embedding requests with a fixed vector and counts the TCP connections it accepts."""
+    protocol_version = "HTTP/1.1"  # keep connections open unless the client closes them
+    connections = 0
+    lock = threading.Lock()
+    body_embed = json.dumps({"embeddings": [[0.1] * DIM]}).encode()
+    body_embedding = json.dumps({"embedding": [0.1] * DIM}).encode()
+
+    def setup(self):
+        super().setup()
+        # Like Ollama's Go server; without it Nagle + delayed ACK stall every reused connection ~40ms
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with StandInOllama.lock:
+            StandInOllama.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = self.body_embed if self.path == "/api/embed" else self.body_embedding
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def bare_post(host):
+    def embed(text):
+        # What the call sites did before: a module-level requests.post, i.e. a fresh connection
+        response = requests.post(f"{host}/api/embeddings", json={"model": "stand-in", "prompt": text}, timeout=10)
+        response.raise_for_status()
+        return response.json()["embedding"]
+    return embed
+
+
+def pooled_client(host):
+    client = EmbeddingClient(host)
+    return lambda text: client.embedding(text, "stand-in")
+
+
+def run(embed, calls, threads):
+    StandInOllama.connections = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(embed, (f"query {i}" for i in range(calls))))
+    return time.perf_counter() - started, StandInOllama.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000, help="embedding calls per run")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="concurrent callers")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInOllama)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_port}"
+
+    clients = {"requests.post per call": bare_post, "EmbeddingClient (pooled)": pooled_client}
+    print(f"{'threads':>7}  {'client':<26}{'calls/s':>10}{'ms/call':>10}{'connections':>13}")
+    for threads in args.threads:
+        for name, make in clients.items():
+            elapsed, connections = run(make(host), args.calls, threads)
+            print(f"{threads:>7}  {name:<26}{args.calls / elapsed:>10.0f}"
+                  f"{1000 * elapsed * threads / args.calls:>10.3f}{connections:>13}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Cold-start time and resident memory of search processes loading index.bin,
+with a private read (faiss.read_index) vs a read-only memory map.
+
+    python benchmarks/bench_index_load.py --processes 4
+    python benchmarks/bench_index_load.py --index path/to/index.bin
+
+Memory figures come from /proc (Linux): RssAnon is private to each process,
+RssFile is page cache it maps, and Pss splits shared pages between the
+processes mapping them, so its sum is what the group really costs.
+"""
+from pathlib import Path
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+import numpy as np
+from search_index import read_index
+
+started = time.perf_counter()
+index, mapped = read_index(__import__("pathlib").Path(sys.argv[2]), mmap=sys.argv[3] == "mmap")
+load_seconds = time.perf_counter() - started
+# One query, as the first search after start-up would
+index.search(np.zeros((1, index.d), dtype=np.float32), 5)
+
+memory = {}
+try:
+    for line in open("/proc/self/status"):
+        if line.startswith(("RssAnon", "RssFile")):
+            memory[line.split(":")[0]] = int(line.split()[1]) / 1024
+    for line in open("/proc/self/smaps_rollup"):
+        if line.startswith("Pss:"):
+            memory["Pss"] = int(line.split()[1]) / 1024
+except OSError:
+    pass
+print(json.dumps({"load_seconds": load_seconds, "mapped": mapped, **memory}), flush=True)
+sys.stdin.read()  # stay alive until every process has reported
+"""
+
+
+def build_synthetic(path: Path, vectors: int, dim: int):
+    import faiss
+    import numpy as np
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    data = np.random.default_rng(0).random((vectors, dim), dtype=np.float32)
+    index.add_with_ids(data, np.arange(vectors, dtype=np.int64))
+    faiss.write_index(index, str(path))
+
+
+def run(index_file: Path, mode: str, processes: int):
+    children = [
+        subprocess.Popen(
+            [sys.executable, "-c", CHILD, str(ROOT), str(index_file), mode],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(processes)
+    ]
+    reports = [json.loads(child.stdout.readline()) for child in children]
+    for child in children:
+        child.stdin.close()
+        child.wait()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", type=Path, help="index file (default: a synthetic flat index)")
+    parser.add_argument("--vectors", type=int, default=200000, help="synthetic index size")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--processes", type=int, default=4, help="concurrent search processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = args.index
+        if index_file is None:
+            index_file = Path(tmp) / "index.bin"
+            build_synthetic(index_file, args.vectors, args.dim)
+        print(f"{index_file} ({index_file.stat().st_size / 2**20:.0f} MB), {args.processes} processes")
+        print(f"{'mode':<6}{'mapped':>8}{'load s':>9}{'RssAnon MB':>12}{'RssFile MB':>12}{'Pss MB':>9}{'total Pss':>11}")
+        for mode in ("read", "mmap"):
+            reports = run(index_file, mode, args.processes)
+            mean = lambda key: sum(r.get(key, 0) for r in reports) / len(reports)
+            print(f"{mode:<6}{str(reports[0]['mapped']):>8}{mean('load_seconds'):>9.3f}{mean('RssAnon'):>12.0f}"
+                  f"{mean('RssFile'):>12.0f}{mean('Pss'):>9.0f}{sum(r.get('Pss', 0) for r in reports):>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Index size and recall of float32 vs quantized vector storage.
+
+    python benchmarks/bench_quantization.py                  # synthetic 768-d vectors
+    python benchmarks/bench_quantization.py --from-index     # vectors stored in faiss_index/metadata.db
+
+Recall@k is measured against exact flat float32 search, with and without
+exact re-ranking of RERANK_FACTOR * k candidates on the stored float vectors.
+"""
+from pathlib import Path
+import argparse
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import faiss
+import numpy as np
+
+from index_factory import build_index, needs_training, search_params
+from search_index import RERANK_FACTOR
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class ArrayStore:
+    """Stands in for MetadataStore.get_vectors over an in-memory matrix."""
+
+    def __init__(self, ids, vectors):
+        self.rows = dict(zip(ids.tolist(), vectors))
+
+    def get_vectors(self, ids):
+        return [self.rows.get(int(i)) for i in ids]
+
+
+def synthetic_vectors(n, dim, seed=0):
+    # Clustered, roughly like sentence embeddings, rather than uniform noise
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, n // 200), dim)).astype(np.float32)
+    vectors = centres[rng.integers(len(centres), size=n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def stored_vectors():
+    conn = sqlite3.connect(str(ROOT / "faiss_index" / "metadata.db"))
+    rows = conn.execute("SELECT vector FROM chunks WHERE vector IS NOT NULL").fetchall()
+    return np.stack([np.frombuffer(blob, dtype=np.float32) for (blob,) in rows])
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+def main():
+    from search_index import rerank_exact
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from-index", action="store_true", help="use the vectors of the local document index")
+    parser.add_argument("-n", type=int, default=50000, help="synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--kinds", nargs="+", default=["flat", "ivf", "hnsw"])
+    args = parser.parse_args()
+
+    vectors = stored_vectors() if args.from_index else synthetic_vectors(args.n, args.dim)
+    queries = vectors[np.random.default_rng(1).choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * np.random.default_rng(2).normal(size=queries.shape).astype(np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    store = ArrayStore(ids, vectors)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, recall@{args.k}, re-rank factor {RERANK_FACTOR}")
+    print(f"{'index':<14}{'size MB':>10}{'bytes/vec':>11}{'recall':>9}{'+rerank':>9}{'ms/query':>10}")
+    for kind in args.kinds:
+        for storage in ("float", "fp16", "sq8", "pq"):
+            index = build_index(kind, vectors.shape[1], vectors if needs_training(kind, storage) else None, storage)
+            index.add_with_ids(vectors, ids)
+            size = len(faiss.serialize_index(index))
+            params = search_params(index)
+            started = time.perf_counter()
+            _, found = index.search(queries, args.k, params=params)
+            elapsed = (time.perf_counter() - started) / len(queries) * 1000
+            _, candidates = index.search(queries, args.k * RERANK_FACTOR, params=params)
+            _, reranked = rerank_exact(queries, candidates, store, args.k)
+            print(f"{kind + '/' + storage:<14}{size / 2**20:>10.1f}{size / len(vectors):>11.0f}"
+                  f"{recall(found, truth):>9.3f}{recall(reranked, truth):>9.3f}{elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
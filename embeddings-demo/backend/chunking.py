@@ -0,0 +1,108 @@
+from typing import Iterator, NamedTuple
+from functools import lru_cache
+import re
+
+CHUNK_SIZE = 256
+CHUNK_OVERLAP = 40
+
+WORD = re.compile(r"\S+")
+# A run of non-blank lines, i.e. a Markdown paragraph, list or heading
+BLOCK = re.compile(r"(?:^[ \t]*\S[^\n]*(?:\n|\Z))+", re.MULTILINE)
+HEADING = re.compile(r"[ \t]*#{1,6}\s")
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int
+    end: int
+
+
+@lru_cache(maxsize=None)
+def _words_pattern(count: int, trailing_space: bool) -> re.Pattern:
+    """Matches `count` consecutive words starting at a word boundary."""
+    if trailing_space:
+        return re.compile(r"(?:\S+\s+){%d}" % count)
+    return re.compile(r"(?:\S+\s+){%d}\S+" % (count - 1))
+
+
+def iter_word_windows(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+                      pos: int = 0, endpos: int = None) -> Iterator[Chunk]:
+    """Overlapping windows of `size` words over text[pos:endpos], found by regex scans.
+
+    Produces the same windows as splitting on whitespace and re-joining
+    words[i:i+size] every `size - overlap` words, but each chunk is a single
+    slice of the original text (whitespace inside it is preserved) and only
+    window boundaries are located, without materialising the word list.
+    """
+    endpos = len(text) if endpos is None else endpos
+    step = _words_pattern(size - overlap, True)
+    # Without overlap a window is exactly the words skipped to reach the next one
+    tail = _words_pattern(overlap, False) if overlap else _words_pattern(size, False)
+    first = WORD.search(text, pos, endpos)
+    start = first.start() if first else endpos
+    while start < endpos:
+        # Skip the `size - overlap` words that only this window has ...
+        match = step.match(text, start, endpos)
+        next_start = match.end() if match else endpos
+        # ... then take the `overlap` words it shares with the next one
+        if overlap:
+            match = tail.match(text, next_start, endpos) if next_start < endpos else None
+        else:
+            match = tail.match(text, start, endpos)
+        if match:
+            end = match.end()
+        else:
+            # Fewer than `size` words left: the window runs to the last word
+            end = start + len(text[start:endpos].rstrip())
+        yield Chunk(text[start:end], start, end)
+        start = next_start
+
+
+def iter_structured_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Chunk]:
+    """Chunks that follow Markdown structure: paragraphs are packed together up to
+    `size` words, a heading always starts a new chunk, and only paragraphs longer
+    than `size` words are split into overlapping word windows."""
+    start = end = None
+    words = 0
+    heading_only = False
+    for block in BLOCK.finditer(text):
+        block_words = len(block.group().split())
+        heading = HEADING.match(text, block.start()) is not None
+        if block_words > size:
+            if start is not None and not heading_only:
+                yield _stripped(text, start, end)
+                start = None
+            # A heading still waiting for its body leads the first window of that body
+            window_start = block.start() if start is None else start
+            yield from iter_word_windows(text, size, overlap, window_start, block.end())
+            start = None
+            continue
+        if start is not None and (heading or words + block_words > size):
+            yield _stripped(text, start, end)
+            start = None
+        if start is None:
+            start, words, heading_only = block.start(), 0, heading
+        else:
+            heading_only = False
+        end = block.end()
+        words += block_words
+    if start is not None:
+        yield _stripped(text, start, end)
+
+
+def _stripped(text: str, start: int, end: int) -> Chunk:
+    chunk = text[start:end].rstrip()
+    return Chunk(chunk, start, start + len(chunk))
+
+
+def iter_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+                structured: bool = False) -> Iterator[Chunk]:
+    """Yield Chunk(text, start, end) with character offsets into `text`."""
+    if structured:
+        return iter_structured_chunks(text, size, overlap)
+    return iter_word_windows(text, size, overlap)
+
+
+def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, structured=False):
+    for chunk in iter_chunks(text, size, overlap, structured):
+        yield chunk.text
@@ -55,14 +55,14 @@ def parse_function_call(response: str) -> tuple[str, Dict[str, Any]]:
         raise
 
 
-async def execute_tool(session: ClientSession, tools: list[Any], response: str) -> ToolCallResult:
-    """Executes a FUNCTION_CALL via MCP tool session."""
+async def execute_tool(session: ClientSession, tools: dict[str, Any], response: str) -> ToolCallResult:
+    """Executes a FUNCTION_CALL via MCP tool session; `tools` maps tool names to tools."""
     logging.info(f"execute_tool {response}")
     try:
         tool_name, arguments = parse_function_call(response)
         logging.info("After parse_function_call")
 
-        tool = next((t for t in tools if t.name == tool_name), None)
+        tool = tools.get(tool_name)
         if not tool:
             raise ValueError(f"Tool '{tool_name}' not found in registered tools")
 
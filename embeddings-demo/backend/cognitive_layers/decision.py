@@ -1,8 +1,9 @@
-from cognitive_layers.perception import PerceptionResult
+from cognitive_layers.perception import GEMINI_TIMEOUT, PerceptionResult
 from cognitive_layers.memory import MemoryItem
 from typing import List, Optional
 from dotenv import load_dotenv
 from google import genai
+import asyncio
 import os
 import logging
 
@@ -15,12 +16,12 @@ logging.basicConfig(
 load_dotenv()
 client = genai.Client(api_key=os.getenv("GEMINI_FLASH_KEY"))
 
-def generate_plan(
+async def generate_plan(
     perception: PerceptionResult,
     memory_items: List[MemoryItem],
     tool_descriptions: Optional[str] = None
 ) -> str:
-    """Generates a plan (tool call or final answer) using LLM based on structured perception and memory."""
+    """Generates a plan (tool call or final answer) using LLM based on structured perception and memory, without blocking the event loop."""
 
     memory_texts = "\n".join(f"- {m.text}" for m in memory_items) or "None"
 
@@ -52,7 +53,7 @@ Input Summary:
 
 Examples:
 - User asks: "Search a phrase 'what is google'". You have to follow below steps:
-  1. FUNCTION_CALL: search_documents|query="what is google"  
+  1. FUNCTION_CALL: search_documents|query="what is google"|mode="phrase"
     1.1 search_documents output: list of URLs from document having 'what is google' phrase
   2. FINAL_ANSWER: open_website|urls=[URLs]
 
@@ -60,6 +61,7 @@ Examples:
 IMPORTANT:
 - Do NOT invent tools. Use only the tools listed below.
 - If the question may relate to factual knowledge, use the 'search_documents' tool to look for the answer.
+- If the user asks for an exact or quoted phrase, call 'search_documents' with mode="phrase"; quotes around the query value are not passed on to the tool.
 - If the previous tool output already contains factual information, DO NOT search again. Instead, summarize the relevant facts and respond with: FINAL_ANSWER: [your answer]
 - Only repeat `search_documents` if the last result was irrelevant or empty.
 - Do NOT repeat function calls with the same parameters.
@@ -70,9 +72,9 @@ IMPORTANT:
 """
 
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
+        response = await asyncio.wait_for(
+            client.aio.models.generate_content(model="gemini-2.0-flash", contents=prompt),
+            GEMINI_TIMEOUT
         )
         raw = response.text.strip()
         logging.info(f"plan, LLM output: {raw}")
@@ -83,6 +85,9 @@ IMPORTANT:
 
         return raw.strip()
 
+    except asyncio.TimeoutError:
+        logging.error(f"plan, Decision generation timed out after {GEMINI_TIMEOUT}s")
+        return "FINAL_ANSWER: [unknown]"
     except Exception as e:
         logging.info(f"plan, Decision generation failed: {e}")
         return "FINAL_ANSWER: [unknown]"
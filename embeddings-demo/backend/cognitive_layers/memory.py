@@ -1,11 +1,16 @@
 # memory.py
 
 import numpy as np
-import faiss
-import requests
 from typing import List, Optional, Literal
 from pydantic import BaseModel
 from datetime import datetime
+from embedding_cache import get_query_cache
+from embedding_client import get_client
+from index_factory import build_index
+import os
+
+# Session memory stays small, so it keeps an exact index unless told otherwise (flat or hnsw)
+MEMORY_INDEX_TYPE = os.getenv("MEMORY_INDEX_TYPE", "flat").lower()
 
 
 class MemoryItem(BaseModel):
@@ -19,7 +24,8 @@ class MemoryItem(BaseModel):
 
 
 class MemoryManager:
-    def __init__(self, embedding_model_url="http://localhost:11434/api/embeddings", model_name="nomic-embed-text"):
+    # A path is sent to the shared client's host (OLLAMA_HOST); an absolute URL is used as is
+    def __init__(self, embedding_model_url="/api/embeddings", model_name="nomic-embed-text"):
         self.embedding_model_url = embedding_model_url
         self.model_name = model_name
         self.index = None
@@ -27,12 +33,18 @@ class MemoryManager:
         self.embeddings: List[np.ndarray] = []
 
     def _get_embedding(self, text: str) -> np.ndarray:
-        response = requests.post(
-            self.embedding_model_url,
-            json={"model": self.model_name, "prompt": text}
-        )
-        response.raise_for_status()
-        return np.array(response.json()["embedding"], dtype=np.float32)
+        # The legacy /api/embeddings endpoint does not normalize its vectors, so keep them
+        # apart from the ones produced through /api/embed by including the URL in the key
+        cache_model = f"{self.model_name}@{self.embedding_model_url}"
+        # Memory texts are per session, so they are kept in the LRU only, not on disk
+        cached = get_query_cache().get(cache_model, text)
+        if cached is not None:
+            return cached
+
+        # Shared pooled client: keep-alive connections, timeouts and retries
+        embedding = get_client().embedding(text, self.model_name, self.embedding_model_url)
+        get_query_cache().put(cache_model, text, embedding)
+        return embedding
 
     def add(self, item: MemoryItem):
         emb = self._get_embedding(item.text)
@@ -41,8 +53,8 @@ class MemoryManager:
 
         # Initialize or add to index
         if self.index is None:
-            self.index = faiss.IndexFlatL2(len(emb))
-        self.index.add(np.stack([emb]))
+            self.index = build_index(MEMORY_INDEX_TYPE, len(emb))
+        self.index.add_with_ids(np.stack([emb]), np.array([len(self.data) - 1], dtype=np.int64))
 
     def retrieve(
         self,
@@ -60,7 +72,7 @@ class MemoryManager:
 
         results = []
         for idx in I[0]:
-            if idx >= len(self.data):
+            if idx < 0 or idx >= len(self.data):
                 continue
             item = self.data[idx]
 
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List
+import asyncio
 import os
 from dotenv import load_dotenv
 from google import genai
@@ -15,17 +16,21 @@ logging.basicConfig(
 load_dotenv()
 
 client = genai.Client(api_key=os.getenv("GEMINI_FLASH_KEY"))
+# Seconds a single Gemini call may take before the layer gives up and falls back
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 30))
+# "incremental": extract once per query and carry the result through follow-up steps; "full": extract on every step
+PERCEPTION_MODE = os.getenv("PERCEPTION_MODE", "incremental")
 
 
 class PerceptionResult(BaseModel):
     user_input: str
-    intent: Optional[str]
+    intent: Optional[str] = None
     entities: List[str] = []
     tool_hint: Optional[str] = None
 
 
-def extract_perception(user_input: str) -> PerceptionResult:
-    """Extracts intent, entities, and tool hints using LLM"""
+async def extract_perception(user_input: str) -> PerceptionResult:
+    """Extracts intent, entities, and tool hints using LLM, without blocking the event loop"""
 
     prompt = f"""
 You are an AI that extracts structured facts from user input.
@@ -41,9 +46,9 @@ Output only the dictionary on a single line. Do NOT wrap it in ```json or other
     """
 
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
+        response = await asyncio.wait_for(
+            client.aio.models.generate_content(model="gemini-2.0-flash", contents=prompt),
+            GEMINI_TIMEOUT
         )
         raw = response.text.strip()
         logging.info(f"perception, LLM output: {raw}")
@@ -64,6 +69,29 @@ Output only the dictionary on a single line. Do NOT wrap it in ```json or other
 
         return PerceptionResult(user_input=user_input, **parsed)
 
+    except asyncio.TimeoutError:
+        logging.error(f"perception, Extraction timed out after {GEMINI_TIMEOUT}s")
+        return PerceptionResult(user_input=user_input)
     except Exception as e:
         logging.info(f"perception, Extraction failed: {e}")
         return PerceptionResult(user_input=user_input)
+
+
+def update_perception(previous: PerceptionResult, user_input: str, last_tool: Optional[str] = None) -> PerceptionResult:
+    """Carries a query's perception to a follow-up step without an LLM call.
+
+    Intent and entities belong to the original task and are kept; only the input
+    (which now holds the previous tool output) changes. A tool hint that was just
+    followed is dropped, so it does not steer the next plan into repeating it.
+    """
+    tool_hint = None if previous.tool_hint == last_tool else previous.tool_hint
+    return previous.model_copy(update={"user_input": user_input, "tool_hint": tool_hint})
+
+
+async def perceive(user_input: str, previous: Optional[PerceptionResult] = None, last_tool: Optional[str] = None) -> PerceptionResult:
+    """Perception for one agent step: a full extraction on the first step, a cached update afterwards"""
+    # Also extract again if the first attempt failed, rather than carrying an empty result
+    if previous is None or previous.intent is None or PERCEPTION_MODE == "full":
+        return await extract_perception(user_input)
+    logging.info("perception, Reusing the query's perception for a follow-up step")
+    return update_perception(previous, user_input, last_tool)
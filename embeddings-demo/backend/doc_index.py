@@ -0,0 +1,297 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+from contextlib import contextmanager
+from metadata_store import MetadataStore
+from index_factory import (
+    INDEX_STORAGE, INDEX_TRAIN_THRESHOLD, INDEX_TYPE,
+    build_index, index_kind, index_storage, needs_training, rebuild, supports_remove, tombstone, tombstoned
+)
+import hashlib
+import json
+import os
+import threading
+import logging
+import faiss
+import numpy as np
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+ROOT = Path(__file__).parent.resolve()
+INDEX_DIR = ROOT / "faiss_index"
+# Write the resident index back to disk after this many added vectors ...
+CHECKPOINT_EVERY = int(os.getenv("INDEX_CHECKPOINT_EVERY", 1000))
+# ... or after this many seconds with unsaved changes, whichever comes first
+CHECKPOINT_INTERVAL = float(os.getenv("INDEX_CHECKPOINT_INTERVAL", 30))
+# Removed vectors of an HNSW index stay as tombstones, skipped by search, until they
+# make up this fraction of the index; only then is the graph rebuilt without them
+COMPACT_THRESHOLD = float(os.getenv("INDEX_COMPACT_THRESHOLD", 0.2))
+
+
+def chunk_id(url: str, position: int) -> int:
+    """Stable 63-bit vector id for the chunk at `position` of `url`."""
+    digest = hashlib.sha1(f"{url}#{position}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def diff_chunks(existing: Dict[int, Tuple[int, str]], chunks: List[str]) -> Tuple[List[int], List[int]]:
+    """Positions of `chunks` that differ from `existing` ({position: (id, hash)}) and the ids they replace."""
+    changed = [
+        position for position, chunk in enumerate(chunks)
+        if position not in existing or existing[position][1] != chunk_hash(chunk)
+    ]
+    stale = [existing[p][0] for p in changed if p in existing]
+    stale += [vector_id for position, (vector_id, _) in existing.items() if position >= len(chunks)]
+    return changed, stale
+
+
+class DocumentIndex:
+    """FAISS index of document chunks, with vector ids keyed by (url, chunk position).
+
+    The index stays resident in memory; writers mutate it under `lock` and it is
+    written back to disk by `checkpoint()`, together with the metadata transaction.
+    """
+
+    def __init__(
+        self,
+        index_dir: Path = INDEX_DIR,
+        checkpoint_every: int = CHECKPOINT_EVERY,
+        index_type: str = INDEX_TYPE,
+        index_storage: str = INDEX_STORAGE,
+        train_threshold: int = INDEX_TRAIN_THRESHOLD,
+        compact_threshold: float = COMPACT_THRESHOLD
+    ):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.index_dir / "index.bin"
+        self.metadata_file = self.index_dir / "metadata.db"
+        self.index = None
+        self.store = MetadataStore(self.metadata_file)
+        self.checkpoint_every = checkpoint_every
+        self.index_type = index_type
+        self.index_storage = index_storage
+        self.train_threshold = train_threshold
+        self.compact_threshold = compact_threshold
+        # Tombstoned rows of an index without remove_ids support (HNSW)
+        self._dead = 0
+        self.lock = threading.RLock()
+        self._dirty = False
+        self._added_since_checkpoint = 0
+        self._transactions = 0
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._stop = threading.Event()
+        self._checkpointer = None
+        self.load()
+
+    def load(self):
+        self._read_index()
+        legacy_file = self.index_dir / "metadata.json"
+        if legacy_file.exists():
+            self._migrate_legacy(json.loads(legacy_file.read_text()))
+            self._dirty = True
+            self.checkpoint()
+            legacy_file.rename(legacy_file.with_suffix(".json.bak"))
+
+    def _read_index(self):
+        self.index = faiss.read_index(str(self.index_file)) if self.index_file.exists() else None
+        self._dead = int(tombstoned(self.index).sum()) if self.index is not None else 0
+
+    def _migrate_legacy(self, metadata):
+        """Move metadata.json into the metadata store.
+
+        A positional IndexFlatL2 with list metadata is rebuilt into an id-mapped index;
+        pages that were ingested several times only keep the rows of their latest save.
+        """
+        if isinstance(metadata, dict):
+            logging.info(f"doc_index, moving {len(metadata)} metadata.json rows to {self.metadata_file.name}")
+            self.store.add_many([{"id": int(vector_id), **meta} for vector_id, meta in metadata.items()])
+            return
+
+        rows = metadata
+        logging.info(f"doc_index, migrating {len(rows)} legacy rows to an id-mapped index")
+        vectors = self.index.reconstruct_n(0, self.index.ntotal) if self.index is not None else None
+        latest_doc = {row["url"]: row["doc"] for row in rows}
+        positions: Dict[str, int] = {}
+        ids, keep, records = [], [], []
+        for row_number, row in enumerate(rows):
+            if row["doc"] != latest_doc[row["url"]]:
+                continue
+            position = positions.get(row["url"], 0)
+            positions[row["url"]] = position + 1
+            vector_id = chunk_id(row["url"], position)
+            ids.append(vector_id)
+            keep.append(row_number)
+            records.append({
+                "id": vector_id,
+                "url": row["url"],
+                "doc": row["doc"],
+                "chunk": row["chunk"],
+                "position": position,
+                "chunk_hash": chunk_hash(row["chunk"]),
+            })
+        self.index = None
+        vectors = np.ascontiguousarray(vectors[keep], dtype=np.float32) if keep else None
+        if keep:
+            # Legacy rows came from /api/embeddings, which does not normalize; scale them like
+            # the /api/embed vectors they are now searched alongside, or L2 search never finds them
+            faiss.normalize_L2(vectors)
+            self._ensure_index(vectors.shape[1])
+            self.index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+        self.store.add_many(records, vectors)
+
+    def _ensure_index(self, dim: int):
+        if self.index is None:
+            # Configurations that need training start flat and are rebuilt once there is enough data
+            if needs_training(self.index_type, self.index_storage):
+                self.index = build_index("flat", dim)
+            else:
+                self.index = build_index(self.index_type, dim, storage=self.index_storage)
+
+    def convert(self, kind: str, storage: str = None):
+        """Rebuild the whole index as `kind` (flat, ivf or hnsw) with `storage` (float, fp16, sq8 or pq)."""
+        storage = storage or self.index_storage
+        with self.lock:
+            if self.index is not None and self.index.ntotal > 0:
+                logging.info(f"doc_index, rebuilding {self.index.ntotal - self._dead} vectors as {kind}/{storage}")
+                self.index = rebuild(
+                    self.index, kind, keep=~tombstoned(self.index), storage=storage, exact_vectors=self.store.get_vectors
+                )
+                self._dead = 0
+            self.index_type = kind
+            self.index_storage = storage
+            self._dirty = True
+
+    def _maybe_compact(self):
+        """Rebuild the index without its tombstones once they pass the compaction threshold."""
+        if self.index is not None and self._dead and self._dead >= self.compact_threshold * self.index.ntotal:
+            logging.info(f"doc_index, compacting {self._dead} of {self.index.ntotal} vectors")
+            self.index = rebuild(
+                self.index, index_kind(self.index), keep=~tombstoned(self.index), exact_vectors=self.store.get_vectors
+            )
+            self._dead = 0
+
+    def _maybe_train(self):
+        if (self.index is not None and needs_training(self.index_type, self.index_storage)
+                and (index_kind(self.index), index_storage(self.index)) != (self.index_type, self.index_storage)
+                and self.index.ntotal >= self.train_threshold):
+            self.convert(self.index_type, self.index_storage)
+
+    def diff(self, url: str, chunks: List[str]) -> Tuple[List[int], List[int]]:
+        """Compare new chunks of `url` with the indexed ones.
+
+        Returns the positions that need (re-)embedding and the ids of vectors to drop.
+        """
+        return diff_chunks(self.store.url_chunks(url), chunks)
+
+    def url_lock(self, url: str) -> threading.Lock:
+        """Lock serialising diff/embed/add of one URL between concurrent ingestions."""
+        with self.lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def remove(self, ids: List[int]):
+        if not ids:
+            return
+        with self.lock:
+            if self.index is not None and supports_remove(self.index):
+                self.index.remove_ids(np.array(ids, dtype=np.int64))
+            elif self.index is not None:
+                # Rebuilding the graph on every removal is far too slow; search skips tombstones instead
+                self._dead += tombstone(self.index, ids)
+            self.store.delete(ids)
+            self._dirty = True
+
+    def add(self, url: str, doc: str, timestamp: str, positions: List[int], chunks: List[str], embeddings: np.ndarray):
+        """Add embeddings for `chunks` found at `positions` of `url`."""
+        ids = [chunk_id(url, position) for position in positions]
+        with self.lock:
+            self._ensure_index(embeddings.shape[1])
+            self.index.add_with_ids(embeddings, np.array(ids, dtype=np.int64))
+            self.store.add_many([
+                {
+                    "id": vector_id,
+                    "url": url,
+                    "doc": doc,
+                    "chunk": chunk,
+                    "position": position,
+                    "chunk_hash": chunk_hash(chunk),
+                    "timestamp": timestamp,
+                }
+                for vector_id, position, chunk in zip(ids, positions, chunks)
+            ], embeddings)
+            self._dirty = True
+            self._added_since_checkpoint += len(ids)
+            if not self._transactions and self._added_since_checkpoint >= self.checkpoint_every:
+                self.checkpoint()
+
+    @contextmanager
+    def transaction(self):
+        """Hold the writer lock across several writes and checkpoint them together.
+
+        If the body raises, every write since the transaction began is rolled back.
+        """
+        with self.lock:
+            if not self._transactions:
+                # Start from a checkpoint, so rolling back to what is on disk undoes exactly this transaction
+                self.checkpoint()
+            self._transactions += 1
+            try:
+                yield self
+            except BaseException:
+                self._transactions -= 1
+                if not self._transactions:
+                    self._rollback()
+                raise
+            self._transactions -= 1
+            if not self._transactions:
+                self.checkpoint()
+
+    def _rollback(self):
+        """Drop every change since the last checkpoint: roll back the metadata and reload the index."""
+        logging.info(f"doc_index, rolling back {self.index_dir.name} to its last checkpoint")
+        self.store.rollback()
+        self._read_index()
+        self._dirty = False
+        self._added_since_checkpoint = 0
+
+    def checkpoint(self):
+        """Write the index to disk and commit the matching metadata rows."""
+        with self.lock:
+            if not self._dirty:
+                return
+            self._maybe_compact()
+            self._maybe_train()
+            if self.index is not None and self.index.ntotal > 0:
+                # Write next to the live file and swap it in, so readers never see a partial index
+                tmp_file = self.index_file.with_suffix(".bin.tmp")
+                faiss.write_index(self.index, str(tmp_file))
+                os.replace(tmp_file, self.index_file)
+            elif self.index_file.exists():
+                self.index_file.unlink()
+            self.store.commit()
+            self._dirty = False
+            self._added_since_checkpoint = 0
+            logging.info(f"Checkpointed FAISS index and metadata ({self.index.ntotal if self.index else 0} vectors)")
+
+    def start_checkpointer(self, interval: float = CHECKPOINT_INTERVAL):
+        """Checkpoint unsaved changes every `interval` seconds on a background thread."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    logging.error(f"doc_index, checkpoint failed: {e}")
+
+        if self._checkpointer is None:
+            self._checkpointer = threading.Thread(target=run, name="index-checkpointer", daemon=True)
+            self._checkpointer.start()
+
+    def close(self):
+        self._stop.set()
+        self.checkpoint()
@@ -0,0 +1,117 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from collections import deque
+import os
+import threading
+import logging
+import numpy as np
+from embedding_cache import EmbeddingCache, get_cache
+from embedding_client import get_client
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+EMBED_MODEL = "nomic-embed-text"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+# Embedding requests allowed in flight against Ollama by this process. The bound is per
+# process: the backend and each of its MCP_POOL_SIZE search servers have their own, so
+# Ollama sees up to EMBED_MAX_IN_FLIGHT + MCP_POOL_SIZE * EMBED_SEARCH_MAX_IN_FLIGHT at once
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", 4))
+# Slots given to each pooled search server; a search embeds its queries in one call
+EMBED_SEARCH_MAX_IN_FLIGHT = int(os.getenv("EMBED_SEARCH_MAX_IN_FLIGHT", 1))
+# Requests a single caller (e.g. one page being ingested) may have in flight
+EMBED_MAX_IN_FLIGHT_PER_CALLER = int(os.getenv("EMBED_MAX_IN_FLIGHT_PER_CALLER", 2))
+
+
+def batched(items, size=EMBED_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+
+def get_embeddings(texts: list[str]) -> np.ndarray:
+    """Embed a list of texts with a single call to the Ollama embed endpoint."""
+    return get_client().embed(texts, EMBED_MODEL)
+
+
+class EmbeddingExecutor:
+    """Bounded worker pool for embedding calls, shared by everything in one process.
+
+    Search servers are separate processes with their own executor (see EMBED_MAX_IN_FLIGHT).
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+        embed_fn=get_embeddings,
+        cache: EmbeddingCache = None,
+        model: str = EMBED_MODEL
+    ):
+        self.max_in_flight = max_in_flight
+        self.model = model
+        self.cache = cache
+        self._embed_fn = embed_fn
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+
+    def submit(self, texts: list[str]) -> Future:
+        # Backpressure: block the caller until a slot frees up instead of queueing unbounded work
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._embed_fn, texts)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _submit_misses(self, texts: list[str], cache: Optional[EmbeddingCache]):
+        if cache is None:
+            return texts, [None] * len(texts), list(range(len(texts))), self.submit(texts), cache
+        vectors = cache.get_many(self.model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        future = self.submit([texts[i] for i in missing]) if missing else None
+        return texts, vectors, missing, future, cache
+
+    def _collect(self, texts, vectors, missing, future, cache):
+        if future is not None:
+            fresh = future.result()
+            if cache is not None:
+                cache.put_many(self.model, [texts[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return texts, np.stack(vectors)
+
+    def embed(self, texts: list[str], persist: bool = True) -> np.ndarray:
+        """Embed texts, serving repeats from the embedding cache.
+
+        With persist=False (one-off texts such as search queries) the on-disk cache is
+        neither read nor written, so it only ever holds document chunks.
+        """
+        return self._collect(*self._submit_misses(texts, self.cache if persist else None))[1]
+
+    def map(self, batches, max_in_flight: int = EMBED_MAX_IN_FLIGHT_PER_CALLER):
+        """Embed batches concurrently, yielding (batch, embeddings) in input order."""
+        window = max(1, min(max_in_flight, self.max_in_flight))
+        pending = deque()
+        for batch in batches:
+            pending.append(self._submit_misses(batch, self.cache))
+            if len(pending) >= window:
+                yield self._collect(*pending.popleft())
+        while pending:
+            yield self._collect(*pending.popleft())
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> EmbeddingExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = EmbeddingExecutor(cache=get_cache())
+            logging.info(f"embedder, started executor with {_executor.max_in_flight} slots")
+        return _executor
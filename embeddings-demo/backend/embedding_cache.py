@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+import numpy as np
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+ROOT = Path(__file__).parent.resolve()
+CACHE_FILE = ROOT / "faiss_index" / "embedding_cache.db"
+# In-process cache for query-time embeddings: entries kept and how long each stays valid
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 3600))
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk cache mapping hash(model, text) to its embedding.
+
+    Only document chunks are stored; query and memory embeddings stay in the
+    in-process QueryEmbeddingCache, so the file grows with the corpus, not with traffic.
+    """
+
+    def __init__(self, path: Path = CACHE_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        # The backend and every search server open this file; WAL lets readers and a writer overlap
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return the cached vector for each text, or None where it has not been embedded yet."""
+        keys = [self.key(model, text) for text in texts]
+        if not keys:
+            return []
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            found = {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+            vectors = [found.get(key) for key in keys]
+            hits = sum(v is not None for v in vectors)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: List[str], vectors) -> None:
+        rows = [
+            (self.key(model, text), np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        self.put_many(model, [text], [vector])
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
+
+
+class QueryEmbeddingCache:
+    """In-memory LRU of recent (model, text) embeddings with a per-entry time to live.
+
+    Sits in front of the on-disk cache for query strings, which repeat within an
+    agent run (memory is retrieved against the original query on every step after
+    the first) and across users. Each process has its own: the backend's serves agent
+    memory, and each MCP server process keeps one for search_documents.
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = (model, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        if self.max_size <= 0:
+            return
+        key = (model, text)
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_query_cache = None
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    global _query_cache
+    with _cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryEmbeddingCache()
+        return _query_cache
@@ -0,0 +1,96 @@
+from typing import List, Optional
+import os
+import threading
+import logging
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+if "://" not in OLLAMA_HOST:
+    OLLAMA_HOST = f"http://{OLLAMA_HOST}"
+EMBED_CONNECT_TIMEOUT = float(os.getenv("EMBED_CONNECT_TIMEOUT", 3))
+# Generous by default: a full batch on a CPU-only Ollama can take a while
+EMBED_READ_TIMEOUT = float(os.getenv("EMBED_READ_TIMEOUT", 120))
+EMBED_RETRIES = int(os.getenv("EMBED_RETRIES", 3))
+# Retries wait backoff * 2 ** (attempt - 1) seconds
+EMBED_BACKOFF = float(os.getenv("EMBED_BACKOFF", 0.5))
+# Keep-alive connections held open per host; at least the number of concurrent embedding calls
+EMBED_POOL_SIZE = int(os.getenv("EMBED_POOL_SIZE", 8))
+
+
+class EmbeddingClient:
+    """HTTP client for the Ollama embedding endpoints, shared by everything in the process.
+
+    One requests.Session keeps connections alive between calls, so a small
+    embedding request does not pay for a new TCP connection each time.
+    Connection errors and 429/5xx responses are retried with exponential
+    backoff; embedding a text twice is harmless, so POSTs are retried too.
+    """
+
+    def __init__(
+        self,
+        host: str = OLLAMA_HOST,
+        connect_timeout: float = EMBED_CONNECT_TIMEOUT,
+        read_timeout: float = EMBED_READ_TIMEOUT,
+        retries: int = EMBED_RETRIES,
+        backoff: float = EMBED_BACKOFF,
+        pool_size: int = EMBED_POOL_SIZE
+    ):
+        self.host = host.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,  # retry POST as well
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, url: str, payload: dict) -> dict:
+        """POST JSON to `url` (absolute, or a path on the Ollama host) and return the JSON reply."""
+        if "://" not in url:
+            url = f"{self.host}{url}"
+        response = self.session.post(url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def embed(self, texts: List[str], model: str) -> np.ndarray:
+        """Embed a list of texts with a single call to /api/embed."""
+        response = self.post("/api/embed", {"model": model, "input": texts})
+        return np.array(response["embeddings"], dtype=np.float32)
+
+    def embedding(self, text: str, model: str, url: Optional[str] = None) -> np.ndarray:
+        """Embed one text with the legacy /api/embeddings endpoint (vectors are not normalized)."""
+        response = self.post(url or "/api/embeddings", {"model": model, "prompt": text})
+        return np.array(response["embedding"], dtype=np.float32)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> EmbeddingClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = EmbeddingClient()
+            logging.info(f"embedding_client, connecting to {_client.host} (timeouts {_client.timeout})")
+        return _client
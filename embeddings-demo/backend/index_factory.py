@@ -0,0 +1,193 @@
+from typing import Optional
+import math
+import os
+import faiss
+import numpy as np
+
+# flat: exact brute-force scan; ivf: inverted lists over k-means cells; hnsw: proximity graph
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").lower()
+# How vectors are held in memory: float (float32), fp16, sq8 (int8 scalar) or pq (product quantized)
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "float").lower()
+# Vectors needed before a flat float index is rebuilt (and trained) as INDEX_TYPE / INDEX_STORAGE
+INDEX_TRAIN_THRESHOLD = int(os.getenv("INDEX_TRAIN_THRESHOLD", 20000))
+IVF_NLIST = int(os.getenv("IVF_NLIST", 0))  # 0 picks ~4 * sqrt(n)
+HNSW_M = int(os.getenv("HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 80))
+PQ_M = int(os.getenv("PQ_M", 64))  # sub-quantizers, must divide the vector dimension
+# Per-query defaults, both can be overridden on each search
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+INDEX_STORAGES = ("float", "fp16", "sq8", "pq")
+SQ_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index doing the actual search, below any id mapping."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_storage(index: faiss.Index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if isinstance(base, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float"
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    return index_kind(index) != "hnsw"
+
+
+def tombstone(index: faiss.Index, ids) -> int:
+    """Mark the vectors of `ids` dead in an index that cannot remove them (HNSW); returns how many.
+
+    Their rows are relabelled -(row + 1), which no chunk id uses, so the tombstones are
+    saved with index.bin and an id re-added later is not hidden by its old row.
+    """
+    labels = faiss.vector_to_array(index.id_map)
+    rows = np.flatnonzero(np.isin(labels, np.asarray(ids, dtype=np.int64)))
+    if len(rows):
+        labels[rows] = -(rows + 1)
+        faiss.copy_array_to_vector(labels, index.id_map)
+        if isinstance(index, faiss.IndexIDMap2):
+            index.construct_rev_map()
+    return len(rows)
+
+
+def tombstoned(index: faiss.Index) -> np.ndarray:
+    """Mask of the rows of an index that are tombstones (none for an index without id mapping)."""
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return np.zeros(index.ntotal, dtype=bool)
+    return faiss.vector_to_array(index.id_map) < 0
+
+
+def live_selector() -> faiss.IDSelector:
+    """Selector skipping tombstoned rows (negative ids)."""
+    negative = faiss.IDSelectorRange(-2 ** 63, 0)
+    sel = faiss.IDSelectorNot(negative)
+    # The C++ selector only holds a pointer, keep the wrapped one alive with it
+    sel.referenced_objects = [negative]
+    return sel
+
+
+def supports_selector(index: faiss.Index) -> bool:
+    """Whether searches can be restricted with an IDSelector; a flat PQ index rejects one."""
+    return not (index_kind(index) == "flat" and index_storage(index) == "pq")
+
+
+def needs_training(kind: str, storage: str = "float") -> bool:
+    return kind == "ivf" or storage in ("sq8", "pq")
+
+
+def build_index(kind: str, dim: int, training_vectors: Optional[np.ndarray] = None,
+                storage: str = "float") -> faiss.Index:
+    """Create an empty id-mapped index of the given kind and storage, trained if it needs to be."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {', '.join(INDEX_TYPES)}")
+    if storage not in INDEX_STORAGES:
+        raise ValueError(f"Unknown index storage '{storage}', expected one of {', '.join(INDEX_STORAGES)}")
+    if needs_training(kind, storage) and (training_vectors is None or len(training_vectors) == 0):
+        raise ValueError(f"A {kind}/{storage} index needs training vectors")
+    if storage == "pq" and dim % PQ_M:
+        raise ValueError(f"PQ_M={PQ_M} does not divide the vector dimension {dim}")
+
+    if kind == "ivf":
+        n = len(training_vectors)
+        # faiss wants ~39 training points per cell; stay under that
+        nlist = IVF_NLIST or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))
+        quantizer = faiss.IndexFlatL2(dim)
+        if storage == "pq":
+            base = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, 8)
+        elif storage in SQ_TYPES:
+            base = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, SQ_TYPES[storage], faiss.METRIC_L2)
+        else:
+            base = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+        sample_size = 256 * nlist
+    elif kind == "hnsw":
+        if storage == "pq":
+            base = faiss.IndexHNSWPQ(dim, PQ_M, HNSW_M)
+        elif storage in SQ_TYPES:
+            base = faiss.IndexHNSWSQ(dim, SQ_TYPES[storage], HNSW_M)
+        else:
+            base = faiss.IndexHNSWFlat(dim, HNSW_M)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        sample_size = 256 * 256
+    else:
+        if storage == "pq":
+            base = faiss.IndexPQ(dim, PQ_M, 8)
+        elif storage in SQ_TYPES:
+            base = faiss.IndexScalarQuantizer(dim, SQ_TYPES[storage], faiss.METRIC_L2)
+        else:
+            base = faiss.IndexFlatL2(dim)
+        sample_size = 256 * 256
+
+    if not base.is_trained:
+        sample = training_vectors
+        if len(sample) > sample_size:
+            sample = sample[np.random.default_rng(0).choice(len(sample), sample_size, replace=False)]
+        base.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return faiss.IndexIDMap2(base)
+
+
+def export_vectors(index: faiss.Index):
+    """All (ids, vectors) held by an id-mapped index, in insertion order.
+
+    Vectors of a quantized index come back decoded, i.e. only approximately.
+    """
+    ids = faiss.vector_to_array(index.id_map)
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.make_direct_map()
+    return ids, base.reconstruct_n(0, base.ntotal)
+
+
+def rebuild(index: faiss.Index, kind: str, keep: Optional[np.ndarray] = None,
+            storage: Optional[str] = None, exact_vectors=None) -> faiss.Index:
+    """Copy every vector of `index` (or only those where `keep` is True) into a new index.
+
+    `exact_vectors(ids)` may return the original float32 rows (None where unknown), so
+    that moving between storages does not compound quantization error.
+    """
+    storage = storage or index_storage(index)
+    ids, vectors = export_vectors(index)
+    if keep is not None:
+        ids, vectors = ids[keep], vectors[keep]
+    if exact_vectors is not None and len(ids):
+        for row, vector in enumerate(exact_vectors(ids)):
+            if vector is not None:
+                vectors[row] = vector
+    new_index = build_index(kind, index.d, vectors if needs_training(kind, storage) else None, storage)
+    if len(ids):
+        new_index.add_with_ids(vectors, ids)
+    return new_index
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                  sel: Optional[faiss.IDSelector] = None):
+    """SearchParameters matching the index kind, or None when there is nothing to set."""
+    kind = index_kind(index)
+    if kind == "ivf":
+        return faiss.SearchParametersIVF(nprobe=nprobe or IVF_NPROBE, sel=sel)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or HNSW_EF_SEARCH, sel=sel)
+    return faiss.SearchParameters(sel=sel) if sel is not None else None
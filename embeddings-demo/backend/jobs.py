@@ -0,0 +1,102 @@
+from pydantic import BaseModel
+from typing import Any, Callable, Dict, Optional
+from collections import OrderedDict
+from datetime import datetime
+import os
+import queue
+import threading
+import uuid
+import logging
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+# Jobs waiting for a worker; further submissions are rejected until the queue drains
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", 100))
+# Finished jobs kept around for /jobs/<id> lookups
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", 500))
+
+
+class Job(BaseModel):
+    id: str
+    status: str = "queued"  # queued | running | success | error
+    url: Optional[str] = None
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
+
+
+class JobQueue:
+    """Local queue of ingestion jobs drained by a fixed set of worker threads."""
+
+    def __init__(
+        self,
+        handler: Callable[..., Dict[str, Any]],
+        workers: int = INGEST_WORKERS,
+        max_queued: int = INGEST_MAX_QUEUED,
+        history: int = JOB_HISTORY
+    ):
+        self.handler = handler
+        self.history = history
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, **payload) -> Job:
+        """Queue a job; raises queue.Full when too many jobs are already waiting."""
+        job = Job(id=uuid.uuid4().hex, url=payload.get("url"), created_at=datetime.now().isoformat())
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait((job, payload))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        with self._lock:
+            self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            job, payload = self._queue.get()
+            job.status = "running"
+            try:
+                job.result = self.handler(job, **payload)
+                job.status = "success"
+            except Exception as e:
+                logging.error(f"jobs, job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = "error"
+            finally:
+                job.finished_at = datetime.now().isoformat()
+                self._queue.task_done()
@@ -0,0 +1,222 @@
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+import asyncio
+import os
+import sys
+import threading
+import time
+import logging
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from embedder import EMBED_SEARCH_MAX_IN_FLIGHT
+from tool_catalog import ToolCatalog, bulleted_description, load_catalog
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+ROOT = Path(__file__).parent.resolve()
+# MCP server processes kept running and initialized, i.e. searches that can run at once without waiting
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", 2))
+# A session that does not answer a ping within this many seconds is replaced
+MCP_HEALTH_TIMEOUT = float(os.getenv("MCP_HEALTH_TIMEOUT", 5))
+# Idle sessions are pinged this often, so a dead server is respawned before a search needs it
+MCP_HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", 30))
+# How long a search waits for a free session
+MCP_BORROW_TIMEOUT = float(os.getenv("MCP_BORROW_TIMEOUT", 60))
+# Pause before starting a replacement, so a server that keeps failing does not spin; it doubles
+# with every server that dies within MCP_RESPAWN_MAX_DELAY seconds of starting, up to that maximum
+MCP_RESPAWN_DELAY = float(os.getenv("MCP_RESPAWN_DELAY", 1))
+MCP_RESPAWN_MAX_DELAY = float(os.getenv("MCP_RESPAWN_MAX_DELAY", 60))
+
+
+def server_params() -> StdioServerParameters:
+    return StdioServerParameters(
+        command=sys.executable,
+        args=["mcp_server.py"],
+        cwd=str(ROOT),
+        # Pass the backend's settings (index, cache, Ollama host) on to the server, with
+        # its own small share of embedding slots, since each server has its own executor
+        env={**os.environ, "EMBED_MAX_IN_FLIGHT": str(EMBED_SEARCH_MAX_IN_FLIGHT)}
+    )
+
+
+class PooledSession:
+    """One MCP server process and its initialized client session."""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.session: Optional[ClientSession] = None
+        self.catalog: Optional[ToolCatalog] = None
+        self.started_at = None
+        self.uses = 0
+        self.closing = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class MCPSessionPool:
+    """Long-lived, pre-initialized MCP sessions that searches borrow instead of spawning a server each.
+
+    Every session is owned by its own task, which starts the server, initializes
+    the session, lists the tools and then waits until the session is retired;
+    the stdio and session contexts are entered and left in that same task.
+    Sessions are pinged before they are lent out and periodically while idle;
+    one that fails is retired and its task starts a replacement.
+    """
+
+    def __init__(self, size: int = MCP_POOL_SIZE, params=server_params):
+        self.size = size
+        self.params = params
+        self._idle: Optional[asyncio.Queue] = None
+        self._members = set()
+        self._spawned = 0
+        self._respawns = 0
+        self._failures = 0
+        self._closed = False
+        self._health_task = None
+
+    async def start(self):
+        """Start the servers in the background; searches wait in session() until one is ready."""
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._spawn()
+        self._health_task = asyncio.create_task(self._health_loop())
+        logging.info(f"mcp_pool, starting {self.size} MCP servers")
+
+    def _spawn(self):
+        self._spawned += 1
+        member = PooledSession(self._spawned)
+        self._members.add(member)
+        member.task = asyncio.create_task(self._run(member))
+
+    async def _run(self, member: PooledSession):
+        try:
+            async with stdio_client(self.params()) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    # Every server in the pool lists the same tools, so they share one catalog
+                    member.catalog = await load_catalog(session, self.params(), bulleted_description)
+                    member.session = session
+                    member.started_at = time.time()
+                    logging.info(f"mcp_pool, session {member.number} ready with {len(member.catalog.tools)} tools")
+                    self._idle.put_nowait(member)
+                    await member.closing.wait()
+        except Exception as e:
+            logging.error(f"mcp_pool, session {member.number} failed: {e}")
+        finally:
+            member.session = None
+            self._members.discard(member)
+            if not self._closed:
+                self._respawns += 1
+                await asyncio.sleep(self._respawn_delay(member))
+                if not self._closed:
+                    self._spawn()
+
+    def _respawn_delay(self, member: PooledSession) -> float:
+        """Exponential backoff while servers keep dying soon after they start."""
+        if member.started_at is not None and time.time() - member.started_at >= MCP_RESPAWN_MAX_DELAY:
+            self._failures = 0
+        else:
+            self._failures += 1
+        delay = min(MCP_RESPAWN_DELAY * 2 ** max(self._failures - 1, 0), MCP_RESPAWN_MAX_DELAY)
+        if self._failures > 1:
+            logging.error(f"mcp_pool, {self._failures} servers failed in a row, next start in {delay:.1f}s")
+        return delay
+
+    async def _healthy(self, member: PooledSession) -> bool:
+        if member.session is None or member.closing.is_set():
+            return False
+        try:
+            await asyncio.wait_for(member.session.send_ping(), MCP_HEALTH_TIMEOUT)
+            return True
+        except Exception as e:
+            logging.error(f"mcp_pool, session {member.number} failed its health check: {e}")
+            return False
+
+    def _retire(self, member: PooledSession):
+        member.closing.set()
+
+    async def _health_loop(self):
+        while not self._closed:
+            await asyncio.sleep(MCP_HEALTH_INTERVAL)
+            # Check whatever is idle right now; sessions in use are checked when they come back
+            for _ in range(self._idle.qsize()):
+                member = self._idle.get_nowait()
+                if await self._healthy(member):
+                    self._idle.put_nowait(member)
+                else:
+                    self._retire(member)
+
+    @asynccontextmanager
+    async def session(self):
+        """Borrow a healthy session: `async with pool.session() as (session, catalog): ...`"""
+        deadline = time.monotonic() + MCP_BORROW_TIMEOUT
+        while True:
+            member = await asyncio.wait_for(self._idle.get(), max(0.0, deadline - time.monotonic()))
+            if await self._healthy(member):
+                break
+            self._retire(member)
+        member.uses += 1
+        try:
+            yield member.session, member.catalog
+        except BaseException:
+            # The session may be left mid-request; replace it rather than lend it out again
+            self._retire(member)
+            raise
+        self._idle.put_nowait(member)
+
+    async def catalog(self) -> ToolCatalog:
+        """Tool catalog of the pooled server, read from a live session without holding one."""
+        for member in self._members:
+            if member.catalog is not None:
+                return member.catalog
+        async with self.session() as (_, catalog):
+            return catalog
+
+    async def close(self):
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+        members = list(self._members)
+        for member in members:
+            self._retire(member)
+        await asyncio.gather(*(member.task for member in members), return_exceptions=True)
+
+    def status(self) -> dict:
+        return {
+            "size": self.size,
+            "alive": sum(member.session is not None for member in self._members),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "respawns": self._respawns,
+            "failures_in_a_row": self._failures,
+            "sessions": [
+                {
+                    "number": member.number,
+                    "started_at": member.started_at,
+                    "uses": member.uses,
+                    "tools_hash": member.catalog.hash if member.catalog is not None else None,
+                }
+                for member in sorted(self._members, key=lambda member: member.number)
+            ],
+        }
+
+
+class BackgroundLoop:
+    """A persistent asyncio event loop on its own thread, for running coroutines from sync code."""
+
+    def __init__(self, name: str = "mcp-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, coro) -> Future:
+        """Schedule `coro` on the loop; await it from another loop with asyncio.wrap_future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run `coro` on the loop and wait for its result."""
+        return self.submit(coro).result(timeout)
@@ -16,6 +16,13 @@ from tqdm import tqdm
 import hashlib
 import logging
 import webbrowser
+from embedder import get_executor
+from embedding_cache import get_query_cache
+from search_index import fuse_rankings
+from shards import open_search_index
+from metadata_store import fts_any, fts_phrase
+from typing import Optional
+from datetime import datetime
 
 logging.basicConfig(
     filename="embeddings-demo.log",  # Log file
@@ -25,21 +32,29 @@ logging.basicConfig(
 
 mcp = FastMCP("EmbeddingsDemo")
 
-EMBED_URL = "http://localhost:11434/api/embeddings"
 EMBED_MODEL = "nomic-embed-text"
 CHUNK_SIZE = 256
 CHUNK_OVERLAP = 40
 ROOT = Path(__file__).parent.resolve()
 
-def get_embedding(text: str) -> np.ndarray:
-    response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
-    response.raise_for_status()
-    return np.array(response.json()["embedding"], dtype=np.float32)
+# Loaded on the first query and kept until index.bin changes on disk
+search_index = open_search_index(ROOT / "faiss_index")
+
+def get_embeddings(texts: list[str]) -> np.ndarray:
+    """Embed queries, serving repeats from the query cache and the rest in one call."""
+    executor = get_executor()
+    cache = get_query_cache()
+    vectors = [cache.get(executor.model, text) for text in texts]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        # Queries are kept in the LRU only, not in the on-disk chunk cache
+        for i, embedding in zip(missing, executor.embed([texts[i] for i in missing], persist=False)):
+            cache.put(executor.model, texts[i], embedding)
+            vectors[i] = embedding
+    return np.stack(vectors)
 
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    words = text.split()
-    for i in range(0, len(words), size - overlap):
-        yield " ".join(words[i:i+size])
+def get_embedding(text: str) -> np.ndarray:
+    return get_embeddings([text])[0]
 
 @mcp.tool()
 def open_website(urls : list[str]) -> None:
@@ -49,26 +64,73 @@ def open_website(urls : list[str]) -> None:
     for url in urls:
         webbrowser.get(chrome_path).open(url, new=1)
 
+def is_quoted(query: str) -> bool:
+    query = query.strip()
+    return len(query) > 1 and query[0] == query[-1] and query[0] in "\"'"
+
+def urls_in_order(ids, metadata) -> list[str]:
+    """Source URL of each vector id, best first, without repeats."""
+    rows = metadata.get_many([idx for idx in ids if idx != -1])
+    return list(dict.fromkeys(rows[idx]['url'] for idx in ids if idx in rows))
+
+def filter_scope(metadata, domain: Optional[str], url_prefix: Optional[str],
+                 ingested_after: Optional[str]) -> Optional[list[int]]:
+    """Vector ids allowed by the search filters, or None when there are no filters."""
+    if not (domain or url_prefix or ingested_after):
+        return None
+    if ingested_after:
+        # Chunk timestamps are written by app.py as %Y%m%d_%H%M%S
+        ingested_after = datetime.fromisoformat(ingested_after).strftime("%Y%m%d_%H%M%S")
+    return metadata.filter_ids(domain, url_prefix, ingested_after)
+
 @mcp.tool()
-def search_documents(query: str) -> list[str]:
-    """Search for relevant content from uploaded documents."""
+def search_documents(query: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                     mode: str = "auto", domain: Optional[str] = None, url_prefix: Optional[str] = None,
+                     ingested_after: Optional[str] = None) -> list[str]:
+    """Search for relevant content from uploaded documents. Returns up to 5 distinct URLs, best first. mode: auto (a "quoted" query is matched as an exact phrase, anything else by meaning), phrase, semantic or hybrid (phrase words and meaning combined). Optional filters: domain (e.g. "wikipedia.org", includes subdomains), url_prefix, ingested_after (ISO date, e.g. "2025-01-31"). nprobe (IVF) and ef_search (HNSW) optionally trade speed for recall."""
     # ensure_faiss_ready()
-    logging.info(f"search_document, query: {query}")
+    logging.info(f"search_document, query: {query}, mode: {mode}, domain: {domain}, url_prefix: {url_prefix}, ingested_after: {ingested_after}")
     try:
-        index = faiss.read_index(str(ROOT / "faiss_index" / "index.bin"))
-        metadata = json.loads((ROOT / "faiss_index" / "metadata.json").read_text())
+        metadata = search_index.metadata()
+        scope = filter_scope(metadata, domain, url_prefix, ingested_after)
+        if mode == "phrase" or (mode == "auto" and is_quoted(query)):
+            # Answered from the BM25 text index, no embedding call
+            hits = metadata.search_text(fts_phrase(query), k=5, ids=scope)
+            if hits or mode == "phrase":
+                return urls_in_order([idx for idx, _ in hits], metadata)
         query_vec = get_embedding(query).reshape(1, -1)
-        D, I = index.search(query_vec, k=5)
-        results = []
-        for idx in I[0]:
-            data = metadata[idx]
-            # results.append(f"{data['chunk']}\n[Source: {data['doc']}, ID: {data['chunk_id']}]")
-            # dict_to_return = {"url":data['url']}
-            results.append(data['url'])
-        return list(set(results))
+        ids = search_index.search_grouped(query_vec, k=5, scope=scope, nprobe=nprobe, ef_search=ef_search)
+        urls = urls_in_order(ids, metadata)
+        if mode == "hybrid":
+            # Fused by URL: the two lists rarely pick the same chunk of a page, so fusing chunk
+            # ids would only interleave them instead of rewarding pages both rank high
+            lexical = urls_in_order([idx for idx, _ in metadata.search_text(fts_any(query), k=5, ids=scope)], metadata)
+            urls = fuse_rankings([urls, lexical])
+        return urls[:5]
     except Exception as e:
         return [f"ERROR: Failed to search: {str(e)}"]
 
+@mcp.tool()
+def search_documents_batch(queries: list[str], nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> dict[str, list[str]]:
+    """Search uploaded documents for several phrasings at once. Returns up to 5 distinct URLs for each query, best first."""
+    logging.info(f"search_documents_batch, queries: {queries}")
+    try:
+        # One embedding call for the queries not already cached and one search over all of
+        # them; each query then gets up to 5 distinct URLs, like search_documents
+        query_vecs = get_embeddings(queries)
+        hits = search_index.grouped_hits_many(query_vecs, k=5, nprobe=nprobe, ef_search=ef_search)
+        return {
+            query: [url for _, _, url in query_hits]
+            for query, query_hits in zip(queries, hits)
+        }
+    except Exception as e:
+        return {query: [f"ERROR: Failed to search: {str(e)}"] for query in queries}
+
+@mcp.tool()
+def index_status() -> dict:
+    """Report the loaded document index: vector count, load time and last reload."""
+    return {**search_index.status(), "query_cache": get_query_cache().stats()}
+
 # log tool
 @mcp.tool()
 def log(a: int) -> float:
@@ -87,7 +149,7 @@ def create_thumbnail(image_path: str) -> Image:
 def ensure_faiss_ready():
     from pathlib import Path
     index_path = ROOT / "faiss_index" / "index.bin"
-    meta_path = ROOT / "faiss_index" / "metadata.json"
+    meta_path = ROOT / "faiss_index" / "metadata.db"
     if not (index_path.exists() and meta_path.exists()):
         logging.info("Index not found — running process_documents()...")
     else:
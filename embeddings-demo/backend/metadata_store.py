@@ -0,0 +1,218 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import json
+import re
+import sqlite3
+import threading
+import numpy as np
+
+COLUMNS = ("id", "url", "doc", "chunk", "position", "chunk_hash", "timestamp")
+WORD = re.compile(r"\w+")
+
+
+def host_key(url_or_domain: str) -> str:
+    """Host with its labels reversed and a trailing dot ("en.wikipedia.org" -> "org.wikipedia.en."),
+    so a domain and all of its subdomains share one indexable prefix."""
+    host = urlparse(url_or_domain).hostname if "://" in url_or_domain else url_or_domain
+    labels = (host or "").lower().strip(".").split(".")
+    return ".".join(reversed(labels)) + "."
+
+
+def prefix_range(prefix: str) -> Tuple[str, str]:
+    """Bounds [low, high) of the strings starting with `prefix`, for an indexed range scan."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def fts_phrase(text: str) -> str:
+    """FTS5 query matching `text` as one exact phrase."""
+    return '"' + " ".join(WORD.findall(text)) + '"'
+
+
+def fts_any(text: str) -> str:
+    """FTS5 query matching chunks with any word of `text`, ranked by BM25."""
+    return " OR ".join(f'"{word}"' for word in WORD.findall(text))
+
+
+class MetadataStore:
+    """Chunk metadata in SQLite, one row per vector id, so lookups never load the whole corpus."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                doc TEXT,
+                chunk TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                timestamp TEXT
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_url ON chunks (url)")
+        self._create_filter_index()
+        # Exact float32 embedding, kept on disk for re-ranking and lossless rebuilds of quantized indexes
+        if "vector" not in {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN vector BLOB")
+        self._create_text_index()
+        self._conn.commit()
+
+    def _create_filter_index(self):
+        """Indexed columns behind filter_ids, so a filtered search only reads the rows in scope."""
+        if "host_key" not in {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN host_key TEXT")
+            # Stores created before the column existed
+            rows = self._conn.execute("SELECT id, url FROM chunks").fetchall()
+            self._conn.executemany(
+                "UPDATE chunks SET host_key = ? WHERE id = ?", [(host_key(url), vector_id) for vector_id, url in rows]
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_host_key ON chunks (host_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_timestamp ON chunks (timestamp)")
+
+    def _create_text_index(self):
+        """BM25 inverted index over chunk text, kept in step with `chunks` by triggers."""
+        # INSERT OR REPLACE only fires the delete trigger for the replaced row with this on
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'"
+        ).fetchone()
+        self._conn.executescript(
+            """CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(chunk, content='chunks', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, chunk) VALUES (new.id, new.chunk);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, chunk) VALUES ('delete', old.id, old.chunk);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE OF chunk ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, chunk) VALUES ('delete', old.id, old.chunk);
+                INSERT INTO chunks_fts (rowid, chunk) VALUES (new.id, new.chunk);
+            END;"""
+        )
+        if not exists:
+            # Stores created before the text index existed: index the chunks already there
+            self._conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+    def get_many(self, ids: List[int]) -> Dict[int, dict]:
+        """Fetch the rows for the given vector ids; unknown ids are left out."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        return {row[0]: dict(zip(COLUMNS, row)) for row in rows}
+
+    def get_vectors(self, ids: List[int]) -> List[Optional[np.ndarray]]:
+        """Stored float32 embeddings for the given ids, None where there is none."""
+        ids = [int(i) for i in ids]
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(ids), 900):
+                part = ids[start:start + 900]
+                found.update(self._conn.execute(
+                    f"SELECT id, vector FROM chunks WHERE vector IS NOT NULL AND id IN ({','.join('?' * len(part))})",
+                    part
+                ).fetchall())
+        return [np.frombuffer(found[i], dtype=np.float32) if i in found else None for i in ids]
+
+    def search_text(self, match: str, k: int, ids: Optional[List[int]] = None) -> List[Tuple[int, float]]:
+        """(vector id, BM25 score) of the best matching chunk of up to `k` distinct URLs for an
+        FTS5 query, best first (lower score is better), only among `ids` if given."""
+        if not match.strip('"'):
+            return []
+        scope, params = "", [match]
+        if ids is not None:
+            # One JSON parameter instead of one per id, so large scopes stay under SQLite's limit
+            scope = "AND rowid IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps([int(i) for i in ids]))
+        with self._lock:
+            # SQLite returns the other columns of the row holding MIN(score) for each group
+            return self._conn.execute(
+                f"""WITH hit AS MATERIALIZED (
+                        SELECT rowid AS id, bm25(chunks_fts) AS score FROM chunks_fts
+                        WHERE chunks_fts MATCH ? {scope}
+                    )
+                    SELECT hit.id, MIN(hit.score) FROM hit JOIN chunks ON chunks.id = hit.id
+                    GROUP BY chunks.url ORDER BY MIN(hit.score) LIMIT ?""",
+                params + [k]
+            ).fetchall()
+
+    def url_ids(self, urls: List[str]) -> List[int]:
+        """Vector ids of every chunk of the given URLs."""
+        urls = list(urls)
+        if not urls:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM chunks WHERE url IN ({','.join('?' * len(urls))})", urls
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def filter_ids(self, domain: Optional[str] = None, url_prefix: Optional[str] = None,
+                   ingested_after: Optional[str] = None) -> List[int]:
+        """Vector ids of the chunks whose URL is on `domain` (or a subdomain of it), starts
+        with `url_prefix` and that were ingested after `ingested_after` (app.py timestamp format)."""
+        # Every filter is a range on an indexed column, so SQLite never scans the whole table
+        clauses, params = [], []
+        if domain:
+            clauses.append("host_key >= ? AND host_key < ?")
+            params += prefix_range(host_key(domain))
+        if url_prefix:
+            clauses.append("url >= ? AND url < ?")
+            params += prefix_range(url_prefix)
+        if ingested_after:
+            clauses.append("timestamp > ?")
+            params.append(ingested_after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id FROM chunks {where}", params).fetchall()
+        return [row[0] for row in rows]
+
+    def url_chunks(self, url: str) -> Dict[int, Tuple[int, str]]:
+        """Map each indexed position of `url` to its (vector id, chunk hash)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT position, id, chunk_hash FROM chunks WHERE url = ?", (url,)
+            ).fetchall()
+        return {position: (vector_id, digest) for position, vector_id, digest in rows}
+
+    def add_many(self, rows: List[dict], vectors: Optional[np.ndarray] = None):
+        columns = COLUMNS + ("host_key", "vector")
+        values = [
+            tuple(row.get(column) for column in COLUMNS)
+            + (host_key(row["url"]), np.asarray(vectors[i], dtype=np.float32).tobytes() if vectors is not None else None)
+            for i, row in enumerate(rows)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO chunks ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                values
+            )
+
+    def delete(self, ids: List[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(int(i),) for i in ids])
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self):
+        with self._lock:
+            self._conn.rollback()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,51 @@
+"""Rebuild faiss_index/index.bin (or every shard of it) as another index type and/or vector storage.
+
+    python migrate_index.py hnsw
+    python migrate_index.py ivf --nlist 4096
+    python migrate_index.py flat --storage sq8
+
+Stop app.py first: it keeps the index in memory and would overwrite the
+migrated file at its next checkpoint.
+"""
+import argparse
+import os
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the document index as another index type or storage.")
+    parser.add_argument("type", choices=["flat", "ivf", "hnsw"], help="index type to migrate to")
+    parser.add_argument("--nlist", type=int, help="IVF cells (default ~4 * sqrt(vectors))")
+    parser.add_argument("--m", type=int, help="HNSW neighbours per node")
+    parser.add_argument("--storage", choices=["float", "fp16", "sq8", "pq"], default="float",
+                        help="how vectors are held in memory (default float32)")
+    args = parser.parse_args()
+
+    # index_factory reads these at import time
+    if args.nlist:
+        os.environ["IVF_NLIST"] = str(args.nlist)
+    if args.m:
+        os.environ["HNSW_M"] = str(args.m)
+    from index_factory import index_kind, index_storage
+    from shards import ShardedIndex, open_document_index
+
+    doc_index = open_document_index(index_type=args.type, index_storage=args.storage)
+    # A sharded index is migrated one shard at a time
+    shards = doc_index.shards() if isinstance(doc_index, ShardedIndex) else [doc_index]
+    if not any(shard.index is not None for shard in shards):
+        print("No index to migrate.")
+        return
+    for shard in shards:
+        if shard.index is None:
+            continue
+        before = f"{index_kind(shard.index)}/{index_storage(shard.index)}"
+        started = time.perf_counter()
+        shard.convert(args.type, args.storage)
+        shard.checkpoint()
+        print(f"{shard.index_dir}: rebuilt {shard.index.ntotal} vectors: {before} -> {args.type}/{args.storage} "
+              f"in {time.perf_counter() - started:.1f}s")
+    print(f"Set INDEX_TYPE={args.type} INDEX_STORAGE={args.storage} for app.py so new vectors keep using it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+from pathlib import Path
+from datetime import datetime
+from typing import Hashable, List, Optional, Tuple
+import os
+import threading
+import time
+import logging
+import faiss
+import numpy as np
+from metadata_store import MetadataStore
+from index_factory import index_kind, index_storage, live_selector, search_params, supports_selector, tombstoned
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Map index.bin read-only instead of reading it into private memory, so concurrent
+# search processes share the page cache and start without a full read
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1").lower() in ("1", "true", "yes")
+# Newer faiss maps flat/HNSW codes as well as IVF lists; older releases only IVF lists
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# Candidates fetched per result from a quantized index and re-ranked on exact float vectors (0 disables)
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", 4))
+# Scopes (filtered searches) up to this many chunks are ranked exactly on their stored
+# vectors instead of searching the index with an id selector
+SCOPE_EXACT_LIMIT = int(os.getenv("SCOPE_EXACT_LIMIT", 2048))
+# Reciprocal rank fusion constant for hybrid search; larger values flatten the rank weighting
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+
+
+class SearchIndex:
+    """Read side of the document index, kept loaded between queries.
+
+    index.bin is only read again when the file on disk changes; the ingestion
+    server replaces it atomically on every checkpoint, so a changed inode,
+    size or mtime means a new generation.
+    """
+
+    def __init__(self, index_dir: Path, mmap: bool = INDEX_MMAP):
+        self.mmap = mmap
+        self.mapped = False
+        self.index_dir = Path(index_dir)
+        self.index_file = self.index_dir / "index.bin"
+        self.metadata_file = self.index_dir / "metadata.db"
+        self.index = None
+        self.store = None
+        self.generation = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self.reloads = 0
+        self.tombstones = 0
+        self._lock = threading.Lock()
+
+    def _disk_generation(self):
+        try:
+            stat = self.index_file.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get(self):
+        """Return (index, metadata store), reloading the index if it changed on disk.
+
+        The ingestion server deletes index.bin when the last vector is removed; the index
+        is then None, and the metadata store stays usable for phrase searches.
+        """
+        with self._lock:
+            generation = self._disk_generation()
+            if generation is None and self.store is None and not self.metadata_file.exists():
+                raise FileNotFoundError(f"No index in {self.index_dir}")
+            if generation != self.generation or self.store is None:
+                started = time.perf_counter()
+                if generation is None:
+                    self.index, self.mapped, self.tombstones = None, False, 0
+                else:
+                    self.index, self.mapped = read_index(self.index_file, self.mmap)
+                    self.tombstones = int(tombstoned(self.index).sum())
+                if self.store is None:
+                    # SQLite (WAL) always sees the latest committed rows, no reload needed
+                    self.store = MetadataStore(self.metadata_file)
+                self.load_seconds = time.perf_counter() - started
+                self.loaded_at = datetime.now().isoformat()
+                self.generation = generation
+                self.reloads += 1
+                vectors = self.index.ntotal if self.index is not None else 0
+                logging.info(f"search_index, loaded {vectors} vectors in {self.load_seconds:.3f}s")
+            return self.index, self.store
+
+    def search(self, query_vecs: np.ndarray, k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, rerank: Optional[int] = None,
+               sel: Optional[faiss.IDSelector] = None):
+        """Search the index, re-ranking a quantized index's candidates on the stored float vectors.
+
+        `sel` restricts the search to the ids it accepts. Tombstoned vectors are never returned.
+        """
+        index, store = self.get()
+        if index is None:
+            return (np.full((len(query_vecs), k), np.inf, dtype=np.float32),
+                    np.full((len(query_vecs), k), -1, dtype=np.int64))
+        rerank = RERANK_FACTOR if rerank is None else rerank
+        if self.tombstones:
+            sel = all_of(live_selector(), sel)
+        if sel is not None and not supports_selector(index):
+            return self._search_post_filtered(index, store, query_vecs, k * max(rerank, 1), sel, k)
+        params = search_params(index, nprobe, ef_search, sel)
+        if index_storage(index) == "float" or rerank <= 1:
+            return index.search(query_vecs, k, params=params)
+        _, candidates = index.search(query_vecs, k * rerank, params=params)
+        return rerank_exact(query_vecs, candidates, store, k)
+
+    def _search_post_filtered(self, index, store, query_vecs, fetch, sel, k):
+        """Filter an unrestricted search for indexes that cannot take a selector, widening it
+        until `fetch` candidates per query pass `sel`, then re-rank them exactly."""
+        wanted = fetch
+        while True:
+            _, I = index.search(query_vecs, min(fetch, index.ntotal))
+            kept = [[int(idx) for idx in row if idx != -1 and sel.is_member(int(idx))] for row in I]
+            if fetch >= index.ntotal or all(len(row) >= wanted for row in kept):
+                break
+            fetch *= 4
+        candidates = np.full((len(kept), max(1, max(map(len, kept)))), -1, dtype=np.int64)
+        for row, ids in enumerate(kept):
+            candidates[row, :len(ids)] = ids
+        return rerank_exact(query_vecs, candidates, store, k)
+
+    def search_grouped(self, query_vec: np.ndarray, k: int, scope: Optional[List[int]] = None,
+                       nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[int]:
+        """Best chunk id for each of up to `k` distinct URLs, best first, searching only `scope` if given."""
+        return [idx for _, idx, _ in self.grouped_hits(query_vec, k, scope, nprobe, ef_search)]
+
+    def grouped_hits(self, query_vec: np.ndarray, k: int, scope: Optional[List[int]] = None,
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Tuple[float, int, str]]:
+        """(distance, chunk id, url) of the best chunk of up to `k` distinct URLs, best first.
+
+        Rather than over-fetching a guessed multiple of k, each round asks for the URLs
+        still missing and excludes every chunk of the URLs already found, so it always
+        makes progress and usually finishes in one or two searches.
+        """
+        index, store = self.get()
+        if index is None:
+            return []
+        if scope is not None and len(scope) <= SCOPE_EXACT_LIMIT:
+            return self._scope_grouped(query_vec, k, scope, store)
+        return self._grouped_rounds(query_vec, k, scope, nprobe, ef_search, store, [], set(), [])
+
+    def grouped_hits_many(self, query_vecs: np.ndarray, k: int, nprobe: Optional[int] = None,
+                          ef_search: Optional[int] = None) -> List[List[Tuple[float, int, str]]]:
+        """grouped_hits for each row of `query_vecs`.
+
+        The first round is a single search over all the queries; only queries still
+        short of `k` URLs after it search again, one at a time.
+        """
+        index, store = self.get()
+        if index is None:
+            return [[] for _ in query_vecs]
+        D, I = self.search(query_vecs, k, nprobe, ef_search)
+        rows = store.get_many([int(idx) for idx in I.ravel() if idx != -1])
+        results = []
+        for query_vec, distances, ids in zip(query_vecs, D, I):
+            hits, seen = [], set()
+            excluded = self._add_hits(store, rows, distances, ids, hits, seen)
+            # A row padded with -1 means the index has nothing more to give this query
+            if len(hits) < k and (ids != -1).all():
+                hits = self._grouped_rounds(query_vec.reshape(1, -1), k, None, nprobe, ef_search,
+                                            store, hits, seen, excluded)
+            results.append(hits[:k])
+        return results
+
+    def _grouped_rounds(self, query_vec: np.ndarray, k: int, scope: Optional[List[int]],
+                        nprobe: Optional[int], ef_search: Optional[int], store: MetadataStore,
+                        hits: List[Tuple[float, int, str]], seen: set, excluded: List[int]):
+        while len(hits) < k:
+            sel = id_selector(scope, excluded)
+            D, I = self.search(query_vec, k - len(hits), nprobe, ef_search, sel=sel)
+            ids = [int(idx) for idx in I[0] if idx != -1]
+            if not ids:
+                break
+            excluded += self._add_hits(store, store.get_many(ids), D[0], I[0], hits, seen)
+        return hits[:k]
+
+    @staticmethod
+    def _add_hits(store: MetadataStore, rows: dict, distances, ids, hits: list, seen: set) -> List[int]:
+        """Append the best chunk of each URL not seen yet in one result row to `hits`.
+
+        Returns the ids a further round has to exclude: every chunk of the URLs just found,
+        and ids without metadata, so they cannot come back every round.
+        """
+        found = []
+        for distance, idx in zip(distances, ids):
+            url = rows[idx]["url"] if idx in rows else None
+            if url is not None and url not in seen:
+                seen.add(url)
+                found.append(url)
+                hits.append((float(distance), int(idx), url))
+        return store.url_ids(found) + [int(idx) for idx in ids if idx != -1 and idx not in rows]
+
+    def _scope_grouped(self, query_vec: np.ndarray, k: int, scope: List[int],
+                       store: MetadataStore) -> List[Tuple[float, int, str]]:
+        rows = store.get_many(scope)
+        # Another shard's part of the scope is simply not found here
+        scope = [idx for idx in scope if idx in rows]
+        if not scope:
+            return []
+        D, I = rerank_exact(query_vec, np.asarray([scope], dtype=np.int64), store, len(scope))
+        hits, seen = [], set()
+        for distance, idx in zip(D[0], I[0]):
+            if idx in rows and rows[idx]["url"] not in seen:
+                seen.add(rows[idx]["url"])
+                hits.append((float(distance), int(idx), rows[idx]["url"]))
+                if len(hits) == k:
+                    break
+        return hits
+
+    def metadata(self) -> MetadataStore:
+        return self.get()[1]
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "index_file": str(self.index_file),
+                "loaded": self.index is not None,
+                "index_type": index_kind(self.index) if self.index is not None else None,
+                "index_storage": index_storage(self.index) if self.index is not None else None,
+                "vectors": self.index.ntotal - self.tombstones if self.index is not None else 0,
+                "tombstones": self.tombstones,
+                "memory_mapped": self.mapped,
+                "load_seconds": self.load_seconds,
+                "loaded_at": self.loaded_at,
+                "reloads": self.reloads,
+                "on_disk": self.index_file.exists(),
+            }
+
+
+def id_selector(include: Optional[List[int]] = None, exclude: Optional[List[int]] = None):
+    """Selector accepting the ids in `include` (all ids if None) that are not in `exclude`."""
+    selectors = []
+    if include is not None:
+        selectors.append(faiss.IDSelectorBatch(np.asarray(include, dtype=np.int64)))
+    if exclude:
+        excluded = faiss.IDSelectorBatch(np.asarray(exclude, dtype=np.int64))
+        selectors.append(faiss.IDSelectorNot(excluded))
+        # The C++ selector only holds a pointer, keep the wrapped one alive with it
+        selectors[-1].referenced_objects = [excluded]
+    return all_of(*selectors)
+
+
+def all_of(*selectors):
+    """Selector accepting the ids every given selector accepts; None entries are ignored."""
+    selectors = [sel for sel in selectors if sel is not None]
+    if not selectors:
+        return None
+    sel = selectors[0]
+    for other in selectors[1:]:
+        both = faiss.IDSelectorAnd(sel, other)
+        both.referenced_objects = [sel, other]
+        sel = both
+    return sel
+
+
+def read_index(path: Path, mmap: bool = INDEX_MMAP):
+    """Load an index, memory-mapped when possible. Returns (index, mapped)."""
+    if mmap:
+        try:
+            return faiss.read_index(str(path), MMAP_FLAGS), True
+        except RuntimeError as e:
+            logging.info(f"search_index, cannot mmap {path.name}, reading it instead: {e}")
+    return faiss.read_index(str(path)), False
+
+
+def rerank_exact(query_vecs: np.ndarray, candidates: np.ndarray, store: MetadataStore, k: int):
+    """Order candidate ids by exact L2 distance to each query, keeping the best k.
+
+    Candidates whose float vector is not stored keep their approximate rank after the exact ones.
+    """
+    D = np.full((len(query_vecs), k), np.inf, dtype=np.float32)
+    I = np.full((len(query_vecs), k), -1, dtype=np.int64)
+    for row, (query, ids) in enumerate(zip(query_vecs, candidates)):
+        ids = ids[ids != -1]
+        vectors = store.get_vectors(ids)
+        exact = [(float(np.sum((v - query) ** 2)), i) for i, v in zip(ids, vectors) if v is not None]
+        approximate = [(np.inf, i) for i, v in zip(ids, vectors) if v is None]
+        ranked = sorted(exact) + approximate
+        for col, (distance, vector_id) in enumerate(ranked[:k]):
+            D[row, col], I[row, col] = distance, vector_id
+    return D, I
+
+
+def fuse_rankings(rankings: List[List[Hashable]], rrf_k: int = HYBRID_RRF_K) -> List[Hashable]:
+    """Merge ranked lists (e.g. of URLs) by reciprocal rank fusion: each list adds 1 / (rrf_k + rank) to an item.
+
+    Ranks are used instead of raw scores because L2 distances and BM25 scores are not comparable.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,299 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import os
+import re
+import threading
+import logging
+import numpy as np
+from doc_index import CHECKPOINT_INTERVAL, INDEX_DIR, DocumentIndex, diff_chunks
+from metadata_store import MetadataStore
+from search_index import SearchIndex
+
+logging.basicConfig(
+    filename="embeddings-demo.log",  # Log file
+    level=logging.INFO,  # Log level
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Split the document index into shards by ingestion "month" or by "domain" (unset: one index)
+INDEX_SHARD_BY = os.getenv("INDEX_SHARD_BY", "").lower()
+# Threads a search fans out over, one shard per thread (faiss releases the GIL while searching)
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", os.cpu_count() or 4))
+
+SHARD_MODES = ("month", "domain")
+SHARDS_DIR = "shards"
+
+
+def shard_key(shard_by: str, url: str, timestamp: Optional[str]) -> str:
+    """Shard directory name for a chunk of `url` ingested at `timestamp` (app.py format, %Y%m%d_%H%M%S)."""
+    if shard_by == "month":
+        month = (timestamp or "")[:6]
+        return month if month.isdigit() else datetime.now().strftime("%Y%m")
+    host = (urlparse(url).hostname or "").lower()
+    return re.sub(r"[^a-z0-9.-]", "_", host) or "_unknown"
+
+
+def shard_dirs(index_dir: Path) -> List[Path]:
+    """Directories holding a shard, oldest first; an index written before sharding counts as the first one."""
+    index_dir = Path(index_dir)
+    dirs = [index_dir] if (index_dir / "index.bin").exists() or (index_dir / "metadata.db").exists() else []
+    shards_dir = index_dir / SHARDS_DIR
+    if shards_dir.is_dir():
+        dirs += sorted(path for path in shards_dir.iterdir() if path.is_dir())
+    return dirs
+
+
+class ShardedIndex:
+    """Write side of a sharded document index: one DocumentIndex, with its own metadata, per shard.
+
+    New chunks go to the shard of their month (always the newest one) or of their
+    domain; older shards only see removals of chunks that changed, and only
+    shards with changes are rewritten at a checkpoint.
+    """
+
+    def __init__(self, index_dir: Path = INDEX_DIR, shard_by: str = INDEX_SHARD_BY, **index_args):
+        if shard_by not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode '{shard_by}', expected one of {', '.join(SHARD_MODES)}")
+        self.index_dir = Path(index_dir)
+        self.shard_by = shard_by
+        self.index_args = index_args
+        self.lock = threading.RLock()
+        self._shards: Dict[Path, DocumentIndex] = {}
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._transaction: Optional[ExitStack] = None
+        self._in_transaction = set()
+        self._stop = threading.Event()
+        self._checkpointer = None
+        for path in shard_dirs(self.index_dir):
+            self._shard(path)
+
+    def _shard(self, path: Path) -> DocumentIndex:
+        with self.lock:
+            shard = self._shards.get(path)
+            if shard is None:
+                shard = self._shards[path] = DocumentIndex(path, **self.index_args)
+                logging.info(f"shards, opened shard {path.name} ({shard.store.count()} chunks)")
+            if self._transaction is not None and path not in self._in_transaction:
+                # A shard first written inside a transaction joins it and is checkpointed with the others
+                self._transaction.enter_context(shard.transaction())
+                self._in_transaction.add(path)
+            return shard
+
+    def shards(self) -> List[DocumentIndex]:
+        with self.lock:
+            return list(self._shards.values())
+
+    def diff(self, url: str, chunks: List[str]) -> Tuple[List[int], List[int]]:
+        """Compare new chunks of `url` with the ones indexed in any shard."""
+        existing = {}
+        for shard in self.shards():
+            existing.update(shard.store.url_chunks(url))
+        return diff_chunks(existing, chunks)
+
+    def url_lock(self, url: str) -> threading.Lock:
+        with self.lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def remove(self, ids: List[int]):
+        """Remove vectors from the shards that hold them, leaving every other shard untouched."""
+        if not ids:
+            return
+        for path, shard in list(self._shards.items()):
+            held = list(shard.store.get_many(ids))
+            if held:
+                self._shard(path).remove(held)
+
+    def add(self, url: str, doc: str, timestamp: str, positions: List[int], chunks: List[str], embeddings: np.ndarray):
+        key = shard_key(self.shard_by, url, timestamp)
+        self._shard(self.index_dir / SHARDS_DIR / key).add(url, doc, timestamp, positions, chunks, embeddings)
+
+    @contextmanager
+    def transaction(self):
+        """Group writes to any number of shards; each shard written is checkpointed once at the end."""
+        with self.lock:
+            if self._transaction is not None:
+                yield self
+                return
+            self._transaction = ExitStack()
+            try:
+                # Leaving the stack ends each shard's transaction, which checkpoints it, or rolls it back if the body raised
+                with self._transaction:
+                    yield self
+            finally:
+                self._transaction = None
+                self._in_transaction.clear()
+
+    def convert(self, kind: str, storage: str = None):
+        for shard in self.shards():
+            shard.convert(kind, storage)
+
+    def checkpoint(self):
+        for shard in self.shards():
+            shard.checkpoint()
+
+    def start_checkpointer(self, interval: float = CHECKPOINT_INTERVAL):
+        """Checkpoint unsaved changes of every shard every `interval` seconds on a background thread."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    logging.error(f"shards, checkpoint failed: {e}")
+
+        if self._checkpointer is None:
+            self._checkpointer = threading.Thread(target=run, name="index-checkpointer", daemon=True)
+            self._checkpointer.start()
+
+    def close(self):
+        self._stop.set()
+        self.checkpoint()
+
+
+class ShardedStore:
+    """Read-only view over the metadata stores of all shards, with the MetadataStore query methods search uses."""
+
+    def __init__(self, stores: List[MetadataStore]):
+        self.stores = stores
+
+    def get_many(self, ids: List[int]) -> Dict[int, dict]:
+        rows = {}
+        for store in self.stores:
+            rows.update(store.get_many(ids))
+        return rows
+
+    def url_ids(self, urls: List[str]) -> List[int]:
+        return [vector_id for store in self.stores for vector_id in store.url_ids(urls)]
+
+    def filter_ids(self, domain: Optional[str] = None, url_prefix: Optional[str] = None,
+                   ingested_after: Optional[str] = None) -> List[int]:
+        return [
+            vector_id for store in self.stores
+            for vector_id in store.filter_ids(domain, url_prefix, ingested_after)
+        ]
+
+    def search_text(self, match: str, k: int, ids: Optional[List[int]] = None) -> List[Tuple[int, float]]:
+        """Best chunk of up to `k` distinct URLs across shards.
+
+        BM25 statistics are per shard, so scores from different shards are only roughly comparable.
+        """
+        hits = sorted(
+            (score, vector_id) for store in self.stores for vector_id, score in store.search_text(match, k, ids)
+        )
+        rows = self.get_many([vector_id for _, vector_id in hits])
+        results, seen = [], set()
+        for score, vector_id in hits:
+            url = rows.get(vector_id, {}).get("url")
+            if url is not None and url not in seen:
+                seen.add(url)
+                results.append((vector_id, score))
+        return results[:k]
+
+    def count(self) -> int:
+        return sum(store.count() for store in self.stores)
+
+
+class ShardedSearchIndex:
+    """Read side of a sharded document index: a SearchIndex per shard, searched in parallel.
+
+    Shards created by the ingestion server after startup are picked up on the next query.
+    """
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self._shards: Dict[Path, SearchIndex] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="shard-search")
+
+    def shards(self) -> List[SearchIndex]:
+        """Shards with vectors; one emptied by removals (its index.bin deleted) is skipped until it has some again."""
+        with self._lock:
+            for path in shard_dirs(self.index_dir):
+                if path not in self._shards and (path / "index.bin").exists():
+                    self._shards[path] = SearchIndex(path)
+            return [shard for shard in self._shards.values() if shard.index_file.exists()]
+
+    def _fan_out(self, search, shards: List[SearchIndex]):
+        if len(shards) == 1:
+            return [search(shards[0])]
+        return list(self._pool.map(search, shards))
+
+    def metadata(self) -> ShardedStore:
+        return ShardedStore([shard.metadata() for shard in self.shards()])
+
+    def search(self, query_vecs: np.ndarray, k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, rerank: Optional[int] = None, sel=None):
+        """Search every shard and keep the overall best `k` per query."""
+        shards = self.shards()
+        if not shards:
+            return (np.full((len(query_vecs), k), np.inf, dtype=np.float32),
+                    np.full((len(query_vecs), k), -1, dtype=np.int64))
+        results = self._fan_out(lambda shard: shard.search(query_vecs, k, nprobe, ef_search, rerank, sel), shards)
+        D = np.concatenate([D for D, _ in results], axis=1)
+        I = np.concatenate([I for _, I in results], axis=1)
+        # Padding (-1) sorts last whatever distance the index reported for it
+        D = np.where(I == -1, np.inf, D)
+        order = np.argsort(D, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def search_grouped(self, query_vec: np.ndarray, k: int, scope: Optional[List[int]] = None,
+                       nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[int]:
+        return [idx for _, idx, _ in self.grouped_hits(query_vec, k, scope, nprobe, ef_search)]
+
+    def grouped_hits(self, query_vec: np.ndarray, k: int, scope: Optional[List[int]] = None,
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Tuple[float, int, str]]:
+        """Best chunk of up to `k` distinct URLs over all shards.
+
+        Each shard's best k URLs include every URL of the overall best k whose best chunk
+        it holds, so merging them is exact even when a URL spans several monthly shards.
+        """
+        shards = self.shards()
+        if not shards:
+            return []
+        results = self._fan_out(lambda shard: shard.grouped_hits(query_vec, k, scope, nprobe, ef_search), shards)
+        return merge_grouped(results, k)
+
+    def grouped_hits_many(self, query_vecs: np.ndarray, k: int, nprobe: Optional[int] = None,
+                          ef_search: Optional[int] = None) -> List[List[Tuple[float, int, str]]]:
+        """grouped_hits for each row of `query_vecs`, one batched search per shard."""
+        shards = self.shards()
+        if not shards:
+            return [[] for _ in query_vecs]
+        results = self._fan_out(lambda shard: shard.grouped_hits_many(query_vecs, k, nprobe, ef_search), shards)
+        return [merge_grouped(per_query, k) for per_query in zip(*results)]
+
+    def status(self) -> dict:
+        shards = [shard.status() for shard in self.shards()]
+        return {
+            "index_dir": str(self.index_dir),
+            "shards": shards,
+            "vectors": sum(shard["vectors"] for shard in shards),
+            "search_workers": SHARD_SEARCH_WORKERS,
+        }
+
+
+def merge_grouped(results, k: int) -> List[Tuple[float, int, str]]:
+    """Merge the grouped hits of several shards into the best chunk of up to `k` distinct URLs."""
+    hits, seen = [], set()
+    for distance, idx, url in sorted(hit for shard_hits in results for hit in shard_hits):
+        if url not in seen:
+            seen.add(url)
+            hits.append((distance, idx, url))
+    return hits[:k]
+
+
+def open_document_index(index_dir: Path = INDEX_DIR, shard_by: str = INDEX_SHARD_BY, **index_args):
+    """The writer for `index_dir`: sharded when INDEX_SHARD_BY is set, a single DocumentIndex otherwise."""
+    if shard_by:
+        return ShardedIndex(index_dir, shard_by, **index_args)
+    return DocumentIndex(index_dir, **index_args)
+
+
+def open_search_index(index_dir: Path):
+    """The reader for `index_dir`, sharded as soon as the ingestion server has written shards."""
+    if INDEX_SHARD_BY or (Path(index_dir) / SHARDS_DIR).is_dir():
+        return ShardedSearchIndex(index_dir)
+    return SearchIndex(index_dir)
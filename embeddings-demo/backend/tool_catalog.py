@@ -0,0 +1,76 @@
+import hashlib
+import json
+import threading
+
+
+def bulleted_description(tools):
+    """Render tools as `- name: description`, one per line, for the decision prompt."""
+    return "\n".join(
+        f"- {tool.name}: {getattr(tool, 'description', 'No description')}"
+        for tool in tools
+    )
+
+
+def tools_hash(tools):
+    """Fingerprint of a tool list: changes whenever a tool, its description or its schema does."""
+    listing = [
+        {"name": tool.name, "description": tool.description, "inputSchema": tool.inputSchema}
+        for tool in tools
+    ]
+    return hashlib.sha256(json.dumps(listing, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def server_identity(server_params):
+    """Identify an MCP server by how it is started."""
+    return json.dumps([server_params.command, list(server_params.args), str(server_params.cwd or "")])
+
+
+class ToolCatalog:
+    """
+    Everything derived from one MCP server's tool list.
+
+    Attributes:
+        tools (list): The tools as listed by the server.
+        by_name (dict): Tool name to tool.
+        schemas (dict): Tool name to its input schema.
+        description (str): Prompt-ready description of all tools.
+        hash (str): Fingerprint of the tool list it was built from.
+    """
+
+    def __init__(self, tools, render, digest):
+        self.tools = list(tools)
+        self.by_name = {tool.name: tool for tool in self.tools}
+        self.schemas = {tool.name: tool.inputSchema or {} for tool in self.tools}
+        self.description = render(self.tools)
+        self.hash = digest
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(server_id, tools, render=bulleted_description):
+    """
+    Return the catalog for a server's tool list, building it only when the list has changed.
+
+    Args:
+        server_id (str): Server identity, see server_identity().
+        tools (list): Tools as returned by session.list_tools().
+        render (callable): Turns the tools into the prompt description.
+
+    Returns:
+        ToolCatalog: The cached or newly built catalog.
+    """
+    digest = tools_hash(tools)
+    key = (server_id, render)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None or catalog.hash != digest:
+            catalog = _catalogs[key] = ToolCatalog(tools, render, digest)
+        return catalog
+
+
+async def load_catalog(session, server_params, render=bulleted_description):
+    """List the tools of an initialized session and return their catalog."""
+    tools_result = await session.list_tools()
+    return get_catalog(server_identity(server_params), tools_result.tools, render)
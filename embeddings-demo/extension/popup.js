@@ -25,18 +25,24 @@ document.addEventListener('DOMContentLoaded', function() {
         return result;
     }
 
-    async function checkTaskStatus(taskId) {
+    async function checkJobStatus(jobId) {
         try {
-            const response = await fetch(`${APP_URL}/task/${taskId}`);
+            const response = await fetch(`${APP_URL}/jobs/${jobId}`);
             const data = await response.json();
             
-            if (data.status === 'processing') {
-                setTimeout(() => checkTaskStatus(taskId), 1000);
+            if (data.status === 'queued' || data.status === 'running') {
+                resultsDiv.innerHTML = `
+                    <div class="result-item">
+                        ${data.status === 'queued'
+                            ? 'Waiting for an ingestion worker...'
+                            : `Processing page... (${data.chunks_embedded}/${data.chunks_total} chunks embedded)`}
+                    </div>`;
+                setTimeout(() => checkJobStatus(jobId), 1000);
             } else {
                 resultsDiv.innerHTML = `
                     <div class="result-item">
                         ${data.status === 'success' 
-                            ? `Page processed successfully! (${data.chunks_processed} chunks created)`
+                            ? `Page processed successfully! (${data.result.chunks_processed} chunks, ${data.result.chunks_embedded} embedded)`
                             : `Error: ${data.error}`}
                     </div>`;
             }
@@ -63,12 +69,17 @@ document.addEventListener('DOMContentLoaded', function() {
             });
             
             const data = await response.json();
-            if (data.status === 'processing') {
+            if (data.job_id) {
                 resultsDiv.innerHTML = `
                     <div class="result-item">
                         Processing page... Please wait.
                     </div>`;
-                checkTaskStatus(data.task_id);
+                checkJobStatus(data.job_id);
+            } else {
+                resultsDiv.innerHTML = `
+                    <div class="result-item">
+                        Error: ${data.error}
+                    </div>`;
             }
         } catch (error) {
             resultsDiv.innerHTML = `